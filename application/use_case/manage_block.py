@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Set, Tuple
 from domain.service.block_service import BlockService
 from infrastructure.monitoring.tracing import trace_span
 from infrastructure.monitoring.logging import StructuredLogger
@@ -16,6 +16,11 @@ class ManageBlockUseCase:
         """Проверить, заблокирован ли пользователь"""
         return self.block_service.is_user_blocked(user_id)
 
+    @trace_span("usecase.get_blocked_user_ids", attributes={"component": "application"})
+    def get_blocked_user_ids(self) -> Set[int]:
+        """Получить ID заблокированных пользователей"""
+        return self.block_service.get_blocked_user_ids()
+
     @trace_span("usecase.block_user", attributes={"component": "application"})
     def block_user(self, target_user_id: int, admin_user_id: int, reason: str = None) -> Tuple[bool, str]:
         """
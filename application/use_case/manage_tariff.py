@@ -1,4 +1,5 @@
 from typing import Tuple, Any
+from datetime import datetime
 from domain.service.tariff_service import TariffService
 from infrastructure.monitoring.tracing import trace_span
 from infrastructure.monitoring.logging import StructuredLogger
@@ -37,19 +38,24 @@ class ManageTariffUseCase:
         """Получить информацию о тарифе пользователя"""
 
         user_tariff = self.tariff_service.get_user_tariff(user_id)
-        tariff = self.tariff_service.get_tariff_by_id(user_tariff.tariff_plan_id)
 
         if not user_tariff:
             return f"ℹ️ У пользователя {user_id} не назначен тарифный план"
 
+        tariff = user_tariff.tariff_plan or self.tariff_service.get_tariff_by_id(user_tariff.tariff_plan_id)
+
         message = f"📋 **Тарифный план: {tariff.name}**\n\n"
 
-        days_remaining = user_tariff.days_remaining()
-        message += f"• Истекает: {user_tariff.expires_at.strftime('%d.%m.%Y %H:%M')}\n"
-        if user_tariff.is_expired():
+        now = datetime.utcnow()
+        days_remaining, expires_str = user_tariff.display(now)
+        if expires_str:
+            message += f"• Истекает: {expires_str}\n"
+        if user_tariff.is_expired(now):
             message += "• ⚠️ **ТАРИФ ИСТЕК**\n\n"
-        else:
+        elif days_remaining is not None:
             message += f"• Осталось дней: {days_remaining}\n\n"
+        else:
+            message += "\n"
 
         message += f"📝 {tariff.description}\n"
         message += f"По всем возникающим вопросам пишете в техподдержку: @youraigirls_manager"
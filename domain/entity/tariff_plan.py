@@ -1,6 +1,6 @@
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
-from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
 
 
 @dataclass
@@ -81,19 +81,42 @@ class UserTariff:
     expires_at: Optional[datetime] = None
     is_active: bool = True
 
+    # Кэш для display(): (дней осталось, дата истечения строкой) и момент, до которого он верен
+    _display: Optional[Tuple[Optional[int], Optional[str]]] = field(default=None, init=False, repr=False, compare=False)
+    _display_valid_until: Optional[datetime] = field(default=None, init=False, repr=False, compare=False)
+
     def __post_init__(self):
         if self.activated_at is None:
             self.activated_at = datetime.utcnow()
 
-    def is_expired(self) -> bool:
+    def is_expired(self, now: datetime = None) -> bool:
         """Проверить истек ли тариф"""
         if self.expires_at is None:
             return False
-        return datetime.utcnow() > self.expires_at
+        return (now or datetime.utcnow()) > self.expires_at
 
     def days_remaining(self) -> Optional[int]:
         """Осталось дней до истечения тарифа"""
         if self.expires_at is None:
             return None
         remaining = self.expires_at - datetime.utcnow()
-        return max(0, remaining.days + 1)
\ No newline at end of file
+        return max(0, remaining.days + 1)
+
+    def display(self, now: datetime = None) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Дней до истечения и дата истечения для отображения ('%d.%m.%Y %H:%M').
+        Результат кэшируется до момента, когда изменится количество оставшихся дней.
+        """
+        if self.expires_at is None:
+            return None, None
+
+        now = now or datetime.utcnow()
+        if self._display is not None and now < self._display_valid_until:
+            return self._display
+
+        remaining = self.expires_at - now
+        days = max(0, remaining.days + 1)
+        # remaining.days уменьшится, когда до истечения останется меньше remaining.days суток
+        self._display_valid_until = self.expires_at - timedelta(days=remaining.days) if days else datetime.max
+        self._display = (days, self.expires_at.strftime('%d.%m.%Y %H:%M'))
+        return self._display
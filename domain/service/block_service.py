@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime
 from domain.entity.user import User
 from infrastructure.database.repositories.user_repository import UserRepository
@@ -120,6 +120,10 @@ class BlockService:
         all_users = self.user_repo.get_all_users()
         return [user for user in all_users if user.is_blocked]
 
+    def get_blocked_user_ids(self) -> Set[int]:
+        """Получить ID заблокированных пользователей"""
+        return self.user_repo.get_blocked_user_ids()
+
     def get_block_info(self, user_id: int) -> Optional[Dict]:
         """Получить информацию о блокировке пользователя"""
         user = self.user_repo.get_user(user_id)
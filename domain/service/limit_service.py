@@ -50,10 +50,7 @@ class LimitService:
 
     def check_rate_limit(self, user_id: int, tariff: TariffPlan) -> Tuple[bool, Optional[str], Optional[Dict]]:
         """Проверить rate limit"""
-        # Сбрасываем счетчики если нужно
-        self.rate_limit_tracking_repo.reset_counters_if_needed(user_id)
-
-        # Получаем текущие счетчики
+        # Получаем текущие счетчики (скользящие окна)
         counters = self.rate_limit_tracking_repo.get_counters(user_id)
 
         # Проверяем лимиты
@@ -127,13 +124,13 @@ class LimitService:
             },
             'time_until_reset': {
                 'minute': self._format_timedelta(
-                    (counters['last_minute_reset'] + timedelta(minutes=1)) - datetime.utcnow()
+                    (counters['minute_window_start'] + timedelta(minutes=1)) - datetime.utcnow()
                 ),
                 'hour': self._format_timedelta(
-                    (counters['last_hour_reset'] + timedelta(hours=1)) - datetime.utcnow()
+                    (counters['hour_window_start'] + timedelta(hours=1)) - datetime.utcnow()
                 ),
                 'day': self._format_timedelta(
-                    (counters['last_day_reset'] + timedelta(days=1)) - datetime.utcnow()
+                    (counters['day_window_start'] + timedelta(days=1)) - datetime.utcnow()
                 )
             }
         }
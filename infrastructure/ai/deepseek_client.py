@@ -35,6 +35,10 @@ class DeepSeekClient(BaseAIClient, AIClientInterface):
 
     async def get_session(self) -> aiohttp.ClientSession:
         """Получить или создать aiohttp сессию (потокобезопасно)"""
+        session = self._session
+        if session is not None and not session.closed:
+            return session
+
         async with self._session_lock:
             if self._session is None or self._session.closed:
                 # Используем ClientTimeout вместо asyncio.TimeoutError
@@ -43,7 +47,9 @@ class DeepSeekClient(BaseAIClient, AIClientInterface):
                     sock_read=self.read_timeout,
                     total=self.total_timeout
                 )
-                self._session = aiohttp.ClientSession(timeout=timeout)
+                # Пул keep-alive соединений: TLS-рукопожатие один раз на соединение, а не на запрос
+                connector = aiohttp.TCPConnector(limit=100, limit_per_host=30, keepalive_timeout=60)
+                self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
             return self._session
 
     @trace_span("deepseek.generate_response", attributes={"component": "ai"})
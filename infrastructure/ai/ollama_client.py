@@ -20,10 +20,15 @@ class OllamaClient(BaseAIClient, AIClientInterface):
 
     async def get_session(self) -> aiohttp.ClientSession:
         """Получить или создать aiohttp сессию (потокобезопасно)"""
+        session = self._session
+        if session is not None and not session.closed:
+            return session
+
         async with self._session_lock:
             if self._session is None or self._session.closed:
                 timeout = aiohttp.ClientTimeout(total=120)
-                self._session = aiohttp.ClientSession(timeout=timeout)
+                connector = aiohttp.TCPConnector(limit=100, limit_per_host=30, keepalive_timeout=60)
+                self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
             return self._session
 
     @trace_span("ollama.generate_response", attributes={"component": "ai"})
@@ -26,4 +26,8 @@ class Database:
 
     def fetch_all(self, query: str, params: tuple = ()):
         """Получить все записи"""
-        return self.db.fetch_all(query, params)
\ No newline at end of file
+        return self.db.fetch_all(query, params)
+
+    def iter_all(self, query: str, params: tuple = (), itersize: int = 2000):
+        """Получить записи потоком через серверный курсор"""
+        return self.db.iter_all(query, params, itersize)
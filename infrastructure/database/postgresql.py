@@ -1,6 +1,6 @@
 import psycopg2
 import psycopg2.extras
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator
 from contextlib import contextmanager
 from infrastructure.monitoring.logging import StructuredLogger
 
@@ -239,6 +239,23 @@ class PostgreSQLDatabase:
             self.logger.error(f"Fetch all error: {e}")
             return []
 
+    def iter_all(self, query: str, params: tuple = (), itersize: int = 2000) -> Iterator[Dict]:
+        """Получить записи потоком через серверный курсор, по itersize строк за раз"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor(name='stream_cursor') as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield dict(row)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.logger.error(f"Iter all error: {e}")
+            raise
+        finally:
+            conn.close()
+
     def execute_many(self, query: str, params_list: List[tuple]) -> int:
         """Выполнить массовую вставку/обновление"""
         try:
@@ -1,165 +1,178 @@
-from typing import Dict
+import threading
+from typing import Dict, Optional
 from datetime import datetime, timedelta
 from infrastructure.database.database import Database
+from infrastructure.database.write_batcher import WriteBatcher
 from infrastructure.monitoring.logging import StructuredLogger
 
 
+# При таком числе пользователей в памяти из кэша выгружаются неактивные
+_MAX_CACHED_USERS = 50_000
+# Неактивный - без сообщений дольше этого: его записи заведомо уже сброшены WriteBatcher'ом в БД,
+# поэтому при следующем обращении бакеты перечитаются из БД без потерь
+_EVICT_IDLE = timedelta(minutes=5)
+
+_INCREMENT_QUERY = '''
+    INSERT INTO user_rate_limit_buckets (user_id, bucket_minute, message_count)
+    VALUES (%s, %s, 1)
+    ON CONFLICT (user_id, bucket_minute) DO UPDATE SET
+        message_count = user_rate_limit_buckets.message_count + 1
+'''
+
+_CLEANUP_QUERY = 'DELETE FROM user_rate_limit_buckets WHERE user_id = %s AND bucket_minute <= %s'
+
+
 class RateLimitTrackingRepository:
-    """Репозиторий для трекинга rate limit (временные счетчики)"""
+    """Репозиторий для трекинга rate limit (временные счетчики).
+
+    Бакеты пользователя читаются из БД один раз и дальше считаются в памяти процесса,
+    в БД только пишутся, чтобы счетчики переживали перезапуск.
+    """
 
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, write_batcher: Optional[WriteBatcher] = None):
         self.db = database
+        self.write_batcher = write_batcher
         self.logger = StructuredLogger("rate_limit_tracking_repository")
+        self._buckets: Dict[int, Dict[datetime, int]] = {}  # {user_id: {bucket_minute: message_count}}
+        self._lock = threading.Lock()
+        # Размер кэша, при котором выгружаются неактивные пользователи (растет, если все активны)
+        self._evict_at = _MAX_CACHED_USERS
         self._init_table()
 
     def _init_table(self):
-        """Инициализация таблицы трекинга"""
+        """Инициализация таблицы трекинга (поминутные бакеты скользящего окна)"""
         try:
             self.db.execute_query('''
-                CREATE TABLE IF NOT EXISTS user_rate_limit_tracking (
-                    user_id BIGINT PRIMARY KEY,
-                    minute_counter INTEGER DEFAULT 0,
-                    hour_counter INTEGER DEFAULT 0,
-                    day_counter INTEGER DEFAULT 0,
-                    last_minute_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_hour_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_day_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CREATE TABLE IF NOT EXISTS user_rate_limit_buckets (
+                    user_id BIGINT NOT NULL,
+                    bucket_minute TIMESTAMP NOT NULL,
+                    message_count INTEGER DEFAULT 0,
 
+                    PRIMARY KEY (user_id, bucket_minute),
                     CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
                 )
             ''')
 
-            self.db.execute_query('''
-                CREATE INDEX IF NOT EXISTS idx_rate_tracking_user_id 
-                ON user_rate_limit_tracking(user_id)
-            ''')
-
             self.logger.info("Rate limit tracking table initialized")
         except Exception as e:
             self.logger.error(f"Error initializing rate limit tracking table: {e}")
 
+    def _load_buckets(self, user_id: int, day_from: datetime) -> Dict[datetime, int]:
+        """Загрузить из БД бакеты пользователя за последние сутки"""
+        try:
+            rows = self.db.fetch_all(
+                '''SELECT bucket_minute, message_count FROM user_rate_limit_buckets
+                   WHERE user_id = %s AND bucket_minute > %s''',
+                (user_id, day_from)
+            )
+        except Exception as e:
+            self.logger.error(f"Error loading rate limit buckets for user {user_id}: {e}")
+            rows = []
+
+        return {self._parse_datetime(row['bucket_minute']): row['message_count'] or 0 for row in rows}
+
+    def _get_buckets(self, user_id: int, now: datetime) -> Dict[datetime, int]:
+        """Бакеты пользователя за последние сутки (из памяти, при первом обращении - из БД)"""
+        day_from = now - timedelta(days=1)
+        buckets = self._buckets.get(user_id)
+        if buckets is None:
+            buckets = self._load_buckets(user_id, day_from)
+            with self._lock:
+                if len(self._buckets) >= self._evict_at:
+                    self._evict_idle_users(now)
+                buckets = self._buckets.setdefault(user_id, buckets)
+
+        with self._lock:
+            for bucket in [bucket for bucket in buckets if bucket <= day_from]:
+                del buckets[bucket]
+
+        return buckets
+
+    def _evict_idle_users(self, now: datetime):
+        """Выгрузить из памяти пользователей без сообщений за _EVICT_IDLE (вызывается под self._lock)"""
+        idle_from = now - _EVICT_IDLE
+        self._buckets = {
+            user_id: buckets for user_id, buckets in self._buckets.items()
+            if buckets and max(buckets) > idle_from
+        }
+        # Если почти все активны, следующая выгрузка - только после заметного роста кэша
+        self._evict_at = max(_MAX_CACHED_USERS, len(self._buckets) * 3 // 2)
+
     def get_counters(self, user_id: int) -> Dict[str, any]:
-        """Получить текущие счетчики пользователя"""
-        result = self.db.fetch_one(
-            '''SELECT minute_counter, hour_counter, day_counter,
-                      last_minute_reset, last_hour_reset, last_day_reset
-               FROM user_rate_limit_tracking WHERE user_id = %s''',
-            (user_id,)
-        )
-
-        if result:
-            return {
-                'minute_counter': result['minute_counter'] or 0,
-                'hour_counter': result['hour_counter'] or 0,
-                'day_counter': result['day_counter'] or 0,
-                'last_minute_reset': self._parse_datetime(result['last_minute_reset']),
-                'last_hour_reset': self._parse_datetime(result['last_hour_reset']),
-                'last_day_reset': self._parse_datetime(result['last_day_reset'])
-            }
-
-        # Если запись не существует, создаем дефолтные значения
+        """
+        Получить текущие счетчики пользователя.
+
+        Окна скользящие: счетчик окна - сумма поминутных бакетов за последний период,
+        *_window_start - начало самого старого бакета в окне (когда он выйдет из окна,
+        освободится место под новые сообщения).
+        """
         now = datetime.utcnow()
+        minute_from = now - timedelta(minutes=1)
+        hour_from = now - timedelta(hours=1)
+
+        minute_counter = hour_counter = day_counter = 0
+        minute_window_start = hour_window_start = day_window_start = None
+
+        buckets = self._get_buckets(user_id, now)
+        with self._lock:
+            items = list(buckets.items())
+
+        for bucket, count in items:
+            day_counter += count
+            if day_window_start is None or bucket < day_window_start:
+                day_window_start = bucket
+            if bucket > hour_from:
+                hour_counter += count
+                if hour_window_start is None or bucket < hour_window_start:
+                    hour_window_start = bucket
+                if bucket > minute_from:
+                    minute_counter += count
+                    if minute_window_start is None or bucket < minute_window_start:
+                        minute_window_start = bucket
+
         return {
-            'minute_counter': 0,
-            'hour_counter': 0,
-            'day_counter': 0,
-            'last_minute_reset': now,
-            'last_hour_reset': now,
-            'last_day_reset': now
+            'minute_counter': minute_counter,
+            'hour_counter': hour_counter,
+            'day_counter': day_counter,
+            'minute_window_start': minute_window_start or now,
+            'hour_window_start': hour_window_start or now,
+            'day_window_start': day_window_start or now
         }
 
     def increment_counters(self, user_id: int):
-        """Увеличить счетчики пользователя"""
+        """Увеличить счетчик текущего минутного бакета и удалить бакеты старше суток"""
         try:
-            # Сначала проверяем и сбрасываем счетчики если нужно
-            counters = self.get_counters(user_id)
             now = datetime.utcnow()
+            bucket_minute = now.replace(second=0, microsecond=0)
 
-            # Проверяем нужно ли сбросить счетчики
-            minute_reset = now - counters['last_minute_reset'] >= timedelta(minutes=1)
-            hour_reset = now - counters['last_hour_reset'] >= timedelta(hours=1)
-            day_reset = now - counters['last_day_reset'] >= timedelta(days=1)
+            buckets = self._get_buckets(user_id, now)
+            with self._lock:
+                buckets[bucket_minute] = buckets.get(bucket_minute, 0) + 1
 
-            # Обновляем счетчики
-            self.db.execute_query('''
-                INSERT INTO user_rate_limit_tracking 
-                (user_id, minute_counter, hour_counter, day_counter,
-                 last_minute_reset, last_hour_reset, last_day_reset, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (user_id) DO UPDATE SET
-                    minute_counter = CASE 
-                        WHEN EXCLUDED.last_minute_reset > user_rate_limit_tracking.last_minute_reset + INTERVAL '1 minute'
-                        THEN 1
-                        ELSE user_rate_limit_tracking.minute_counter + 1
-                    END,
-                    hour_counter = CASE 
-                        WHEN EXCLUDED.last_hour_reset > user_rate_limit_tracking.last_hour_reset + INTERVAL '1 hour'
-                        THEN 1
-                        ELSE user_rate_limit_tracking.hour_counter + 1
-                    END,
-                    day_counter = CASE 
-                        WHEN EXCLUDED.last_day_reset > user_rate_limit_tracking.last_day_reset + INTERVAL '1 day'
-                        THEN 1
-                        ELSE user_rate_limit_tracking.day_counter + 1
-                    END,
-                    last_minute_reset = CASE 
-                        WHEN EXCLUDED.last_minute_reset > user_rate_limit_tracking.last_minute_reset + INTERVAL '1 minute'
-                        THEN EXCLUDED.last_minute_reset
-                        ELSE user_rate_limit_tracking.last_minute_reset
-                    END,
-                    last_hour_reset = CASE 
-                        WHEN EXCLUDED.last_hour_reset > user_rate_limit_tracking.last_hour_reset + INTERVAL '1 hour'
-                        THEN EXCLUDED.last_hour_reset
-                        ELSE user_rate_limit_tracking.last_hour_reset
-                    END,
-                    last_day_reset = CASE 
-                        WHEN EXCLUDED.last_day_reset > user_rate_limit_tracking.last_day_reset + INTERVAL '1 day'
-                        THEN EXCLUDED.last_day_reset
-                        ELSE user_rate_limit_tracking.last_day_reset
-                    END,
-                    updated_at = EXCLUDED.updated_at
-            ''', (
-                user_id,
-                1,  # minute_counter
-                1,  # hour_counter
-                1,  # day_counter
-                now, now, now, now  # все reset времена и updated_at
-            ))
+            self._write(_INCREMENT_QUERY, (user_id, bucket_minute))
+            self._write(_CLEANUP_QUERY, (user_id, now - timedelta(days=1)), key=user_id)
 
         except Exception as e:
             self.logger.error(f"Error incrementing counters for user {user_id}: {e}")
 
-    def reset_counters_if_needed(self, user_id: int):
-        """Сбросить счетчики если период истек"""
+    def _write(self, query: str, params: tuple, key=None):
+        """Записать в БД сразу или через WriteBatcher, если он подключен"""
+        if self.write_batcher:
+            self.write_batcher.add(query, params, key=key)
+        else:
+            self.db.execute_query(query, params)
+
+    def clear_counters(self, user_id: int):
+        """Обнулить счетчики пользователя"""
+        with self._lock:
+            self._buckets.pop(user_id, None)
         try:
-            counters = self.get_counters(user_id)
-            now = datetime.utcnow()
-
-            # Проверяем каждый период
-            minute_needs_reset = now - counters['last_minute_reset'] >= timedelta(minutes=1)
-            hour_needs_reset = now - counters['last_hour_reset'] >= timedelta(hours=1)
-            day_needs_reset = now - counters['last_day_reset'] >= timedelta(days=1)
-
-            if minute_needs_reset or hour_needs_reset or day_needs_reset:
-                self.db.execute_query('''
-                    UPDATE user_rate_limit_tracking SET
-                        minute_counter = CASE WHEN %s THEN 0 ELSE minute_counter END,
-                        hour_counter = CASE WHEN %s THEN 0 ELSE hour_counter END,
-                        day_counter = CASE WHEN %s THEN 0 ELSE day_counter END,
-                        last_minute_reset = CASE WHEN %s THEN %s ELSE last_minute_reset END,
-                        last_hour_reset = CASE WHEN %s THEN %s ELSE last_hour_reset END,
-                        last_day_reset = CASE WHEN %s THEN %s ELSE last_day_reset END,
-                        updated_at = %s
-                    WHERE user_id = %s
-                ''', (
-                    minute_needs_reset, hour_needs_reset, day_needs_reset,
-                    minute_needs_reset, now, hour_needs_reset, now, day_needs_reset, now,
-                    now, user_id
-                ))
-
+            # Иначе еще не записанные инкременты попадут в БД после удаления и вернут счетчики
+            if self.write_batcher:
+                self.write_batcher.flush_sync()
+            self.db.execute_query('DELETE FROM user_rate_limit_buckets WHERE user_id = %s', (user_id,))
         except Exception as e:
-            self.logger.error(f"Error resetting counters for user {user_id}: {e}")
+            self.logger.error(f"Error clearing counters for user {user_id}: {e}")
 
     def _parse_datetime(self, dt_value) -> datetime:
         """Парсинг datetime"""
@@ -1,12 +1,14 @@
-from typing import Optional, List
+from typing import Optional, List, Set
 from datetime import datetime
 from domain.entity.user import User
 from infrastructure.database.database import Database
+from infrastructure.database.write_batcher import WriteBatcher
 
 
 class UserRepository:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, write_batcher: Optional[WriteBatcher] = None):
         self.db = database
+        self.write_batcher = write_batcher
         self._init_table()
 
     def _init_table(self):
@@ -152,12 +154,50 @@ class UserRepository:
 
         return blocked_users
 
+    def get_blocked_user_ids(self) -> Set[int]:
+        """Получить ID всех заблокированных пользователей"""
+        results = self.db.fetch_all('SELECT user_id FROM users WHERE is_blocked = TRUE')
+        return {result['user_id'] for result in results}
+
     def update_last_seen(self, user_id: int):
         """Обновить время последней активности пользователя"""
-        self.db.execute_query(
-            'UPDATE users SET last_seen = %s WHERE user_id = %s',
-            (datetime.now(), user_id)
-        )
+        query = 'UPDATE users SET last_seen = %s WHERE user_id = %s'
+        params = (datetime.now(), user_id)
+        if self.write_batcher:
+            self.write_batcher.add(query, params, key=user_id)
+        else:
+            self.db.execute_query(query, params)
+
+    def upsert_user_activity(self, user: User):
+        """Создать пользователя, если его нет, иначе отметить активность и сбросить состояние проактива"""
+        self.db.execute_query('''
+            INSERT INTO users
+            (user_id, username, first_name, last_name, current_character_id, is_admin, is_blocked,
+             blocked_reason, blocked_at, blocked_by, last_seen, last_proactive_sent_at, proactive_missed_count, proactive_enabled, bot_blocked_at, utm_label)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET
+                last_seen = EXCLUDED.last_seen,
+                last_proactive_sent_at = NULL,
+                proactive_missed_count = 0,
+                proactive_enabled = TRUE
+        ''', (
+            user.user_id,
+            user.username,
+            user.first_name,
+            user.last_name,
+            user.current_character_id,
+            user.is_admin,
+            user.is_blocked,
+            user.blocked_reason,
+            user.blocked_at,
+            user.blocked_by,
+            user.last_seen,
+            user.last_proactive_sent_at,
+            user.proactive_missed_count,
+            user.proactive_enabled,
+            user.bot_blocked_at,
+            user.utm_label
+        ))
 
     def delete_user(self, user_id: int):
         """Удалить пользователя"""
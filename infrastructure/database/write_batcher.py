@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from typing import Dict, Hashable, List, Optional
+
+from infrastructure.monitoring.logging import StructuredLogger
+
+
+class WriteBatcher:
+    """Копит мелкие записи в БД и выполняет их пачками (execute_many) из фоновой задачи.
+
+    Записи группируются по тексту запроса. Если передан key, более поздняя запись с тем же
+    ключом заменяет предыдущую (например, last_seen пользователя - важно только последнее значение).
+    """
+
+    def __init__(self, database, flush_interval: float = 1.0, max_pending: int = 4000):
+        self.db = database
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.logger = StructuredLogger("write_batcher")
+
+        self._pending: Dict[str, Dict[Hashable, tuple]] = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        # Сброс из фоновой задачи и явный flush_sync() не должны идти одновременно
+        self._flush_lock = threading.Lock()
+        self._flush_event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def add(self, query: str, params: tuple, key: Hashable = None):
+        """Поставить запись в очередь на запись"""
+        with self._lock:
+            batch = self._pending.setdefault(query, {})
+            if key is None:
+                key = object()
+            if key not in batch:
+                self._pending_count += 1
+            batch[key] = params
+            full = self._pending_count >= self.max_pending
+
+        if full and self._loop is not None:
+            # add() может вызываться из рабочих потоков
+            self._loop.call_soon_threadsafe(self._flush_event.set)
+
+    def _take_pending(self) -> Dict[str, Dict[Hashable, tuple]]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+        return pending
+
+    def flush_sync(self) -> int:
+        """Записать все накопленное в БД, вернуть число записей.
+
+        Когда вернулся, все записи, добавленные до вызова, уже в БД (или отброшены с ошибкой в логе).
+        """
+        written = 0
+        with self._flush_lock:
+            for query, batch in self._take_pending().items():
+                written += self._write_batch(query, list(batch.values()))
+        return written
+
+    def _write_batch(self, query: str, params_list: List[tuple]) -> int:
+        """Записать пачку одним execute_many; если она упала - построчно, пропуская ошибочные строки"""
+        try:
+            self.db.execute_many(query, params_list)
+            return len(params_list)
+        except Exception as e:
+            self.logger.error(f"Batch write failed ({len(params_list)} rows), retrying row by row: {e}")
+
+        # Одна ошибочная строка (например, пользователь удален) не должна терять записи остальных
+        written = 0
+        for params in params_list:
+            try:
+                self.db.execute_query(query, params)
+                written += 1
+            except Exception as e:
+                self.logger.error(f"Write skipped for params {params}: {e}")
+        return written
+
+    async def flush(self) -> int:
+        return await asyncio.to_thread(self.flush_sync)
+
+    async def run(self):
+        """Фоновый цикл: сбрасывает очередь раз в flush_interval или при переполнении"""
+        self._loop = asyncio.get_running_loop()
+        self._flush_event = asyncio.Event()
+        self.logger.info("Write batcher started")
+
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+
+                if self._pending_count:
+                    await self.flush()
+        finally:
+            # Дописываем остаток при остановке
+            self.flush_sync()
+            self.logger.info("Write batcher stopped")
@@ -1,8 +1,11 @@
+import asyncio
+import os
 from typing import Dict, Any
 from dataclasses import dataclass
 from infrastructure.monitoring.logging import StructuredLogger
 from infrastructure.database.database import Database
 from infrastructure.ai.ai_factory import AIFactory
+from domain.interfaces.ai_client import AIClientInterface
 
 
 @dataclass
@@ -13,10 +16,11 @@ class HealthStatus:
 
 
 class HealthChecker:
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, ai_client: AIClientInterface = None):
         self.logger = StructuredLogger("health")
         self.database = database
-        self.ai_client = AIFactory.create_client()
+        # Общий клиент бота: своя сессия и модели эмбеддингов на каждую проверку не нужны
+        self.ai_client = ai_client or AIFactory.create_client()
         self.checks = {
             'database': self.check_database,
             'ai_provider': self.check_ai_provider,
@@ -78,27 +82,48 @@ class HealthChecker:
             "memory_percent": round(process.memory_percent(), 2)
         }
 
+    def _build_status(self, results: Dict[str, Dict[str, Any]]) -> HealthStatus:
+        """Собрать общий статус по результатам отдельных проверок"""
+        overall_status = "healthy"
+
+        for result in results.values():
+            if result["status"] == "unhealthy":
+                overall_status = "unhealthy"
+            elif result["status"] == "degraded" and overall_status == "healthy":
+                overall_status = "degraded"
+
+        return HealthStatus(
+            status=overall_status,
+            details=results,
+            timestamp=__import__('datetime').datetime.utcnow().isoformat() + "Z"
+        )
+
     def perform_health_check(self) -> HealthStatus:
         results = {}
-        overall_status = "healthy"
 
         for check_name, check_func in self.checks.items():
             try:
-                result = check_func()
-                results[check_name] = result
-
-                if result["status"] == "unhealthy":
-                    overall_status = "unhealthy"
-                elif result["status"] == "degraded" and overall_status == "healthy":
-                    overall_status = "degraded"
-
+                results[check_name] = check_func()
             except Exception as e:
                 self.logger.error(f"Health check {check_name} failed: {e}")
                 results[check_name] = {"status": "unhealthy", "error": str(e)}
-                overall_status = "unhealthy"
 
-        return HealthStatus(
-            status=overall_status,
-            details=results,
-            timestamp=__import__('datetime').datetime.utcnow().isoformat() + "Z"
-        )
\ No newline at end of file
+        return self._build_status(results)
+
+    async def perform_health_check_async(self) -> HealthStatus:
+        """Выполнить все проверки параллельно в рабочих потоках"""
+        names = list(self.checks)
+        outcomes = await asyncio.gather(
+            *(asyncio.to_thread(self.checks[name]) for name in names),
+            return_exceptions=True
+        )
+
+        results = {}
+        for check_name, outcome in zip(names, outcomes):
+            if isinstance(outcome, Exception):
+                self.logger.error(f"Health check {check_name} failed: {outcome}")
+                results[check_name] = {"status": "unhealthy", "error": str(outcome)}
+            else:
+                results[check_name] = outcome
+
+        return self._build_status(results)
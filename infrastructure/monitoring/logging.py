@@ -38,7 +38,20 @@ class StructuredLogger:
     def set_trace_id(self, trace_id: str):
         self.trace_id = trace_id
 
-    def _log_with_context(self, level: int, message: str, extra: Dict[str, Any] = None):
+    def bind(self, **context) -> 'BoundLogger':
+        """Получить логгер с заранее привязанным контекстом (user_id, username и т.д.)"""
+        return BoundLogger(self, context)
+
+    def isEnabledFor(self, level: int) -> bool:
+        """Включен ли уровень: чтобы не собирать extra для записей, которые все равно отбросятся"""
+        return self.logger.isEnabledFor(level)
+
+    def _log_with_context(self, level: int, message: str, args: tuple = (), extra: Dict[str, Any] = None,
+                          exc_info: bool = False):
+        # Аргументы форматируются модулем logging лениво, только если уровень включен
+        if not self.logger.isEnabledFor(level):
+            return
+
         extra_data = extra or {}
         extra_data['trace_id'] = self.trace_id
 
@@ -50,19 +63,19 @@ class StructuredLogger:
         extra_data['service'] = 'friend-bot'
         extra_data['component'] = self.logger.name
 
-        self.logger.log(level, message, extra=extra_data)
+        self.logger.log(level, message, *args, extra=extra_data, exc_info=exc_info)
 
-    def info(self, message: str, extra: Dict[str, Any] = None):
-        self._log_with_context(logging.INFO, message, extra)
+    def info(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log_with_context(logging.INFO, message, args, extra, exc_info)
 
-    def error(self, message: str, extra: Dict[str, Any] = None):
-        self._log_with_context(logging.ERROR, message, extra)
+    def error(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log_with_context(logging.ERROR, message, args, extra, exc_info)
 
-    def warning(self, message: str, extra: Dict[str, Any] = None):
-        self._log_with_context(logging.WARNING, message, extra)
+    def warning(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log_with_context(logging.WARNING, message, args, extra, exc_info)
 
-    def debug(self, message: str, extra: Dict[str, Any] = None):
-        self._log_with_context(logging.DEBUG, message, extra)
+    def debug(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log_with_context(logging.DEBUG, message, args, extra, exc_info)
 
     def metric(self, name: str, value: float, tags: Dict[str, str] = None):
         """Логирование метрик для ELK"""
@@ -76,6 +89,37 @@ class StructuredLogger:
         self.info(f"METRIC: {name} = {value}", extra=extra)
 
 
+class BoundLogger:
+    """Обертка над StructuredLogger, добавляющая привязанный контекст к каждой записи"""
+
+    def __init__(self, logger: StructuredLogger, context: Dict[str, Any]):
+        self._logger = logger
+        self.context = context
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, message: str, args: tuple, extra: Dict[str, Any], exc_info: bool):
+        # Контекст копируется, только если запись действительно будет выведена
+        if not self._logger.isEnabledFor(level):
+            return
+        # _log_with_context дополняет extra, поэтому привязанный контекст всегда копируем
+        merged = {**self.context, **extra} if extra else dict(self.context)
+        self._logger._log_with_context(level, message, args, merged, exc_info)
+
+    def info(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log(logging.INFO, message, args, extra, exc_info)
+
+    def error(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log(logging.ERROR, message, args, extra, exc_info)
+
+    def warning(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log(logging.WARNING, message, args, extra, exc_info)
+
+    def debug(self, message: str, *args, extra: Dict[str, Any] = None, exc_info: bool = False):
+        self._log(logging.DEBUG, message, args, extra, exc_info)
+
+
 def setup_logging():
     """Настройка логирования для ELK"""
     root_logger = logging.getLogger()
@@ -70,6 +70,23 @@ class MetricsCollector:
             'Total number of Telegram retry attempts'
         )
 
+        self.telegram_rate_limit_granted = Counter(
+            'telegram_rate_limit_granted_total',
+            'Total number of sends allowed by the Telegram rate limiter'
+        )
+
+        self.telegram_rate_limit_blocked = Counter(
+            'telegram_rate_limit_blocked_total',
+            'Total number of sends rejected by the Telegram rate limiter',
+            ['reason']
+        )
+
+        self.telegram_rate_limit_wait = Histogram(
+            'telegram_rate_limit_wait_seconds',
+            'Time a send waited in the Telegram rate limiter',
+            buckets=[0, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]
+        )
+
         # Метрики для аналитики по пользователям (будем использовать Gauge для уникальных значений)
         self.paywall_user_reached = Gauge('paywall_user_reached', 'Users who reached paywall', ['user_id', 'character_id'])
 
@@ -140,6 +157,16 @@ class MetricsCollector:
         """Записать попадание в лимит Telegram"""
         self.telegram_rate_limit_hits.inc()
 
+    def record_telegram_rate_limit_granted(self, wait_time: float):
+        """Записать разрешенную rate limiter'ом отправку и время ожидания"""
+        self.telegram_rate_limit_granted.inc()
+        self.telegram_rate_limit_wait.observe(wait_time)
+
+    def record_telegram_rate_limit_blocked(self, reason: str):
+        """Записать отказ rate limiter'а в отправке"""
+        self.telegram_rate_limit_blocked.labels(reason=reason).inc()
+        self.telegram_rate_limit_hits.inc()
+
     def record_telegram_retry(self):
         """Записать повторную попытку отправки в Telegram"""
         self.telegram_retry_attempts.inc()
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS user_rate_limit_buckets (
+    user_id BIGINT NOT NULL,
+    bucket_minute TIMESTAMP NOT NULL,
+    message_count INTEGER DEFAULT 0,
+
+    PRIMARY KEY (user_id, bucket_minute),
+    CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+DROP TABLE IF EXISTS user_rate_limit_tracking;
\ No newline at end of file
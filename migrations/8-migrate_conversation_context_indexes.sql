@@ -0,0 +1,9 @@
+-- Диалоги пользователя с персонажем (история в боте, выборка сообщений в scripts/analyze_conversations.py)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_context_user_character_ts
+ON conversation_context (user_id, character_id, timestamp)
+WHERE deleted_at IS NULL;
+
+-- Отбор диалогов за период по всем персонажам: index-only scan без обращения к таблице
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_context_ts
+ON conversation_context (timestamp DESC) INCLUDE (character_id, user_id, role)
+WHERE deleted_at IS NULL;
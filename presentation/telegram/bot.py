@@ -1,16 +1,23 @@
 import os
+import re
+import logging
+import time
 import asyncio
+import functools
+import weakref
 
 import tempfile
+from datetime import datetime
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile, LabeledPrice
-from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, ApplicationBuilder, PreCheckoutQueryHandler
+from telegram.ext import MessageHandler, filters, ContextTypes, CallbackQueryHandler, ApplicationBuilder, PreCheckoutQueryHandler, TypeHandler
 from telegram.constants import ParseMode
 
 from presentation.telegram.markdown_utils import MarkdownFormatter
 from presentation.telegram.middleware import TelegramMiddleware
 
 from infrastructure.database.database import Database
+from infrastructure.database.write_batcher import WriteBatcher
 from infrastructure.database.repositories.user_repository import UserRepository
 from infrastructure.database.repositories.profile_repository import ProfileRepository
 from infrastructure.database.repositories.conversation_repository import ConversationRepository
@@ -56,23 +63,288 @@ from application.use_case.send_proactive import SendProactiveMessageUseCase
 from presentation.telegram.message_sender import get_telegram_sender, get_telegram_rate_limiter
 
 
+def _md(text: str) -> str:
+    """Экранирование постоянного текста под MarkdownV2 - один раз при импорте модуля"""
+    return MarkdownFormatter.format_text(text, ParseMode.MARKDOWN_V2)
+
+
+# Тексты, обернутые в _md, уже экранированы: отправлять через _safe_reply(..., escaped=True)
+_ADMIN_DENIED = _md("❌ Эта команда доступна только администраторам")
+_MSG_BAD_UID = _md("❌ Неверный формат ID пользователя")
+_MSG_BLOCKED = _md("🚫 Вы заблокированы и не можете отправлять сообщения.\n\n"
+                   "Если вы считаете, что это ошибка, свяжитесь с администратором.")
+_MSG_TECH_PROBLEM = _md("😔 Извини, у меня небольшие технические проблемы. Можешь повторить?")
+_MSG_PAYMENT_FAILED = "Произошла ошибка обработки платежа. Попробуйте позже."
+
+_ADMIN_HELP_TEXT = _md("""
+👑 **Административные команды:**
+
+📋 **Списки и информация:**
+• `/admin_users [страница]` - список всех пользователей
+• `/admin_blocked_list` - список заблокированных
+
+📊 **Статистика и информация:**
+• `/admin_stats` - общая статистика пользователей
+• `/admin_userinfo [user_id]` - информация о пользователе
+• `/admin_message_stats [user_id]` - статистика сообщений
+• `/admin_user_tariff [user_id]` - тариф пользователя
+
+🚫 **Управление блокировками:**
+• `/admin_block <user_id> [причина]` - заблокировать пользователя
+• `/admin_unblock <user_id>` - разблокировать пользователя
+• `/admin_blocked_list` - список заблокированных
+• `/admin_block_info <user_id>` - информация о блокировке
+
+ **Примеры использования:**
+`/admin_message_stats 123456789` - статистика сообщений
+
+💡 **Примеры использования:**
+`/admin_user_tariff 123456789` - посмотреть тариф пользователя
+
+📊 **Обычные команды (для всех):**
+• `/start` - начать общение
+• `/limits` - лимиты сообщений
+• `/reset` - сбросить разговор
+• `/tariff` - твой тариф
+• `/all_tariffs` - все тарифы
+• `/tariff_info <ID>` - информация о тарифе
+""")
+
+_HELP_TEXT = _md("""
+Команды:
+/start - начать общение
+/info - текущая история
+/reset - сбросить разговор
+/premium - перейти на премиум
+/help - помощь
+
+Я запомню:
+• Как тебя зовут
+• Твой возраст
+• Твои интересы
+• Твое настроение
+
+Просто напиши что-то вроде:
+"Меня зовут Анна, мне 25 лет"
+"Я люблю читать и гулять в парке"
+"Мне сегодня грустно"
+
+По всем возникающим вопросам пишете в техподдержку: @youraigirls_manager
+""")
+
+_ADMIN_BLOCK_USAGE = (
+    "❌ Использование: /admin_block <user_id> [причина]\n\n"
+    "Пример:\n"
+    "/admin_block 123456789 Нарушение правил\n"
+    "/admin_block 987654321"
+)
+
+# Параметры провайдеров для лога конфигурации: (ключ, переменная окружения, значение по умолчанию)
+_PROVIDER_CONFIG = {
+    "openai": (("openai_model", "OPENAI_MODEL", "gpt-3.5-turbo"),),
+    "ollama": (("ollama_model", "OLLAMA_MODEL", "llama2:7b"),
+               ("ollama_url", "OLLAMA_URL", "http://localhost:11434")),
+    "gemini": (("gemini_model", "GEMINI_MODEL", "gemini-pro"),),
+    "huggingface": (("hf_model", "HF_MODEL", "microsoft/DialoGPT-large"),),
+    "deepseek": (("deepseek_model", "DEEPSEEK_MODEL", "deepseek-chat"),
+                 ("deepseek_url", "DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")),
+}
+
+# Пользовательские команды: (команда, метод FriendBot)
+_USER_COMMANDS = (
+    ("start", "start"),
+    ("info", "info"),
+    ("reset", "reset"),
+    # ("limits", "limits"),
+    ("premium", "tariff"),
+    ("help", "help"),
+)
+
+# Административные команды, обработчик каждой - метод FriendBot.admin_<name>
+_ADMIN_COMMANDS = (
+    "users", "help", "stats", "userinfo", "health",
+    # Блокировки
+    "block", "unblock", "blocked_list", "block_info",
+    # Лимиты сообщений и тарифы
+    "message_stats", "user_tariff",
+)
+
+# Эмодзи статусов для /admin_health
+_STATUS_EMOJI = {"healthy": "🟢", "degraded": "🟡"}
+_CHECK_EMOJI = {"healthy": "✅", "degraded": "⚠️"}
+
+# Кэш прав администратора
+_ADMIN_CACHE_TTL = 60.0
+_ADMIN_CACHE_MAX_SIZE = 2048
+
+# Одинаковый ответ в тот же чат в течение этого времени повторно не отправляется
+_REPLY_DEDUP_TTL = 5.0
+_REPLY_DEDUP_MAX_CHATS = 10_000
+
+# Как часто перечитывать из БД множество заблокированных пользователей
+_BLOCKED_IDS_TTL = 60.0
+
+# Кэш ответов read-only админских списков
+_LISTING_CACHE_TTL = 5.0
+_LISTING_CACHE_MAX_SIZE = 256
+
+# Запас до лимита Telegram в 4096 символов на сообщение (считается после экранирования)
+_MAX_MESSAGE_LENGTH = 4000
+
+# payload счета: payment_<дней>_<user_id>_<tariff_plan_id>_<payment_id>
+_PAYMENT_PAYLOAD_RE = re.compile(r"payment_(\d+)_(\d+)_(\d+)_(\d+)", re.ASCII)
+
+# Telegram ID и номера страниц - только десятичные ASCII-цифры
+_TID_RE = re.compile(r"\d{1,20}", re.ASCII)
+
+
+def _parse_int_arg(arg: str):
+    """Разбирает числовой аргумент команды без исключений, None - если формат неверный"""
+    if not _TID_RE.fullmatch(arg):
+        return None
+    return int(arg)
+
+
+def _escaped_length(text: str) -> int:
+    return len(MarkdownFormatter.format_text(text, ParseMode.MARKDOWN_V2))
+
+
+def _split_long_message(text: str, limit: int = _MAX_MESSAGE_LENGTH, separators=('\n\n', '\n')) -> list:
+    """Делит текст на части, каждая из которых после экранирования влезает в одно сообщение"""
+    if _escaped_length(text) <= limit:
+        return [text]
+
+    if not separators:
+        # Экранирование MarkdownV2 не более чем удваивает длину
+        step = limit // 2
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    separator, rest = separators[0], separators[1:]
+    chunks = []
+    current = ''
+    for part in text.split(separator):
+        candidate = f'{current}{separator}{part}' if current else part
+        if _escaped_length(candidate) <= limit:
+            current = candidate
+            continue
+
+        if current:
+            chunks.append(current)
+
+        if _escaped_length(part) <= limit:
+            current = part
+        else:
+            pieces = _split_long_message(part, limit, rest)
+            chunks.extend(pieces[:-1])
+            current = pieces[-1]
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def serialized_per_user(handler):
+    """
+    Обновления обрабатываются параллельно (concurrent_updates), но обновления одного
+    пользователя - по очереди: иначе, например, /reset перемешается с еще не записанным ответом AI
+    """
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is None:
+            return await handler(self, update, context)
+
+        lock = self._user_locks.get(user.id)
+        if lock is None:
+            lock = self._user_locks[user.id] = asyncio.Lock()
+
+        async with lock:
+            return await handler(self, update, context)
+
+    return wrapper
+
+
+def admin_only(handler):
+    """Пропускает к обработчику только администраторов, остальным отвечает отказом"""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self._is_admin(update.effective_user.id):
+            await self._safe_reply(update, _ADMIN_DENIED, escaped=True)
+            return
+        return await handler(self, update, context)
+
+    return wrapper
+
+
+def target_user_arg(usage: str = None):
+    """Передает обработчику ID пользователя из первого аргумента; без аргумента - usage или свой ID"""
+    if usage is not None:
+        usage = _md(usage)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+            args = context.args
+            if not args:
+                if usage is not None:
+                    await self._safe_reply(update, usage, escaped=True)
+                    return
+                return await handler(self, update, context, update.effective_user.id)
+
+            target_user_id = _parse_int_arg(args[0])
+            if target_user_id is None:
+                await self._safe_reply(update, _MSG_BAD_UID, escaped=True)
+                return
+            return await handler(self, update, context, target_user_id)
+
+        return wrapper
+
+    return decorator
+
+
 class FriendBot:
     def __init__(self):
         self.application = None
+        self._ready = False
         self._setup_logging()
         self._log_configuration()
 
+        # Инфраструктура, AI клиент и use cases создаются в setup() (post_init приложения)
+        self.ai_client = None
+
+        self.middleware = TelegramMiddleware(self.logger)
+
+        self.user_character_selections = {}  # {user_id: {'page': 0, 'characters': []}}
+        self._last_reply = {}  # {chat_id: (hash(text), monotonic time)}
+        self._admin_cache = {}  # {user_id: (is_admin, monotonic expiry)}
+        self._inflight = {}  # {key: asyncio.Future} для одновременных одинаковых запросов
+        self._command_map = {}  # {команда: обработчик}, заполняется в setup_handlers
+        self._listing_cache = {}  # {key: (text, monotonic expiry)}
+        self._blocked_ids = set()
+        self._blocked_ids_expiry = 0.0
+        self._proactive_task = None
+        self._write_batcher_task = None
+        self._user_locks = weakref.WeakValueDictionary()  # {user_id: asyncio.Lock}, пока кто-то держит lock
+
+    async def setup(self, application):
+        """Тяжелая инициализация: мониторинг, БД, AI клиент и use cases"""
+        if self._ready:
+            return
+
         self._setup_monitoring()
 
         # Инициализация инфраструктуры
         self.database = Database()
-        self.user_repo = UserRepository(self.database)
+        # Частые мелкие записи (last_seen, счетчики rate limit) пишутся пачками в фоне
+        self.write_batcher = WriteBatcher(self.database)
+        self.user_repo = UserRepository(self.database, self.write_batcher)
         self.profile_repo = ProfileRepository(self.database)
         self.conversation_repo = ConversationRepository(self.database)
         self.tariff_repo = TariffRepository(self.database)
         self.rag_repo = RAGRepository(self.database)
         self.user_stats_repo = UserStatsRepository(self.database)
-        self.rate_limit_tracking_repo = RateLimitTrackingRepository(self.database)
+        self.rate_limit_tracking_repo = RateLimitTrackingRepository(self.database, self.write_batcher)
         self.character_repo = CharacterRepository(self.database)
         self.summary_repo = SummaryRepository(self.database)
         self.payment_repo = PaymentRepository(self.database)
@@ -92,7 +364,7 @@ class FriendBot:
         self.summary_service = SummaryService(self.ai_client)
         self.proactive_service = ProactiveService(self.ai_client, self.tariff_service, self.conversation_repo, self.character_repo, self.profile_repo)
 
-        self.health_checker = HealthChecker(self.database)
+        self.health_checker = HealthChecker(self.database, self.ai_client)
 
         # Инициализация Telegram rate limiter и sender
         self.telegram_sender = get_telegram_sender()
@@ -120,12 +392,16 @@ class FriendBot:
             telegram_sender=self.telegram_sender
         )
 
-        self.middleware = TelegramMiddleware()
+        self._ready = True
+        self.logger.info("FriendBot initialized successfully")
 
-        self.user_character_selections = {}  # {user_id: {'page': 0, 'characters': []}}
-        self._proactive_task = None
+    async def _post_init(self, application):
+        await self.setup(application)
+        self._write_batcher_task = asyncio.create_task(self.write_batcher.run())
+        await self._start_proactive_worker(application)
 
-        self.logger.info("FriendBot initialized successfully")
+    async def _post_shutdown(self, application):
+        await self.cleanup()
 
     async def _start_proactive_worker(self, application):
         """Запускается после инициализации приложения."""
@@ -144,7 +420,7 @@ class FriendBot:
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                self.logger.error(f"Proactive worker error: {e}", exc_info=True)
+                self.logger.error("Proactive worker error: %s", e, exc_info=True)
                 await asyncio.sleep(60)
 
     async def show_character_carousel(self, update: Update, page: int = 0):
@@ -229,7 +505,7 @@ class FriendBot:
                 raise Exception("Failed to send photo")
 
         except Exception as e:
-            self.logger.error(f'Error sending character photo: {e}')
+            self.logger.error('Error sending character photo: %s', e)
             # Если не удалось отправить фото, отправляем только текст
             text = f'*{character.name}*\n\n{character.description}\n\nИспользуйте кнопки навигации для просмотра других персонажей.'
             escaped_text = MarkdownFormatter.format_text(text, ParseMode.MARKDOWN_V2)
@@ -240,6 +516,7 @@ class FriendBot:
                 reply_markup=reply_markup
             )
 
+    @serialized_per_user
     async def handle_character_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
@@ -280,7 +557,7 @@ class FriendBot:
                                 parse_mode=ParseMode.MARKDOWN_V2
                             )
                         except Exception as e:
-                            self.logger.warning(f'Could not edit caption, sending new message: {e}')
+                            self.logger.warning('Could not edit caption, sending new message: %s', e)
                             # Если не удалось отредактировать caption, отправляем новое сообщение
                             await self._safe_send_message(
                                 chat_id,
@@ -297,7 +574,7 @@ class FriendBot:
                     await query.answer(message, show_alert=True)
 
             except Exception as e:
-                self.logger.error(f'Error selecting character: {e}')
+                self.logger.error('Error selecting character: %s', e)
                 await query.answer('❌ Ошибка при выборе персонажа', show_alert=True)
 
         elif data == 'char_page_info':
@@ -316,6 +593,10 @@ class FriendBot:
         try:
             bot = self.application.bot
 
+            if not await self.rate_limiter.try_acquire(chat_id, "send_avatar"):
+                self.logger.warning('Rate limit exceeded, avatar not sent to chat %s', chat_id)
+                return False
+
             # Пробуем использовать cached file_id для всех типов
             if character and character.avatar_file_id:
                 try:
@@ -325,10 +606,10 @@ class FriendBot:
                     else:
                         await bot.send_photo(chat_id=chat_id, photo=character.avatar_file_id, caption=caption,
                                              parse_mode=parse_mode, reply_markup=reply_markup)
-                    self.logger.debug(f'Used cached file_id ({mime_type}) for character {character.id}')
+                    self.logger.debug('Used cached file_id (%s) for character %s', mime_type, character.id)
                     return True
                 except Exception as e:
-                    self.logger.warning(f'Cached file_id invalid, reuploading: {e}')
+                    self.logger.warning('Cached file_id invalid, reuploading: %s', e)
 
             # Если file_id нет или он невалидный - загружаем файл заново
             import tempfile
@@ -354,7 +635,7 @@ class FriendBot:
                             success = self.character_repo.update_character_avatar_file_id(character.id, file_id)
                             if success:
                                 character.update_avatar_file_id(file_id)
-                                self.logger.info(f'Saved animation file_id for character {character.id}')
+                                self.logger.info('Saved animation file_id for character %s', character.id)
                     else:
                         # Оригинальная логика для фото
                         message = await bot.send_photo(
@@ -376,9 +657,9 @@ class FriendBot:
                 try:
                     os.unlink(temp_file_path)
                 except Exception as e:
-                    self.logger.warning(f'Could not delete temp file {temp_file_path}: {e}')
+                    self.logger.warning('Could not delete temp file %s: %s', temp_file_path, e)
         except Exception as e:
-            self.logger.error(f'Error sending avatar (type: {mime_type}): {e}')
+            self.logger.error('Error sending avatar (type: %s): %s', mime_type, e)
             return False
 
     async def _send_photo_with_bytes(self, chat_id: int, photo_bytes: bytes, caption: str = None,
@@ -393,6 +674,10 @@ class FriendBot:
             return False
 
         try:
+            if not await self.rate_limiter.try_acquire(chat_id, "send_photo"):
+                self.logger.warning('Rate limit exceeded, photo not sent to chat %s', chat_id)
+                return False
+
             if character and character.avatar_file_id:
                 try:
                     await self.application.bot.send_photo(
@@ -403,10 +688,10 @@ class FriendBot:
                         reply_markup=reply_markup
                     )
 
-                    self.logger.debug(f'Used cached file_id for character {character.id}')
+                    self.logger.debug('Used cached file_id for character %s', character.id)
                     return True
                 except Exception as e:
-                    self.logger.warning(f'Cached file_id invalid, reuploading: {e}')
+                    self.logger.warning('Cached file_id invalid, reuploading: %s', e)
 
             with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
                 temp_file.write(photo_bytes)
@@ -432,17 +717,17 @@ class FriendBot:
 
                     if success:
                         character.update_avatar_file_id(file_id)
-                        self.logger.info(f'Saved avatar file_id for character {character.id}')
+                        self.logger.info('Saved avatar file_id for character %s', character.id)
 
                 return True
             finally:
                 try:
                     os.unlink(temp_file_path)
                 except Exception as e:
-                    self.logger.warning(f'Could not delete temp file {temp_file_path}: {e}')
+                    self.logger.warning('Could not delete temp file %s: %s', temp_file_path, e)
 
         except Exception as e:
-            self.logger.error(f'Error sending photo: {e}')
+            self.logger.error('Error sending photo: %s', e)
             return False
 
     async def _send_typing_status(self, chat_id: int) -> bool:
@@ -453,14 +738,22 @@ class FriendBot:
 
         return await self.telegram_sender.send_typing_status(bot=self.application.bot, chat_id=chat_id)
 
-    async def _safe_reply(self, update: Update, text: str, **kwargs) -> bool:
-        """Безопасный ответ на сообщение с учетом лимитов Telegram"""
+    async def _safe_reply(self, update: Update, text: str, escaped: bool = False, **kwargs) -> bool:
+        """Безопасный ответ на сообщение с учетом лимитов Telegram; escaped - текст уже экранирован (_md)"""
         if not hasattr(self, 'application') or not self.application:
             self.logger.error("Bot application not available")
             return False
 
-        escaped_text = MarkdownFormatter.format_text(text, ParseMode.MARKDOWN_V2)
-        return await self.telegram_sender.reply_to_message(
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        text_hash = hash(text)
+        now = time.monotonic()
+        previous = self._last_reply.get(chat_id)
+        if previous and previous[0] == text_hash and now - previous[1] < _REPLY_DEDUP_TTL:
+            # Тот же ответ только что уже ушел в этот чат
+            return True
+
+        escaped_text = text if escaped else MarkdownFormatter.format_text(text, ParseMode.MARKDOWN_V2)
+        success = await self.telegram_sender.reply_to_message(
             bot=self.application.bot,
             update=update,
             parse_mode=ParseMode.MARKDOWN_V2,
@@ -468,6 +761,33 @@ class FriendBot:
             **kwargs
         )
 
+        if success and chat_id is not None:
+            self._remember_reply(chat_id, text_hash, now)
+
+        return success
+
+    def _remember_reply(self, chat_id: int, text_hash: int, now: float):
+        """Запомнить последний ответ в чат, периодически вычищая устаревшие записи"""
+        if len(self._last_reply) >= _REPLY_DEDUP_MAX_CHATS:
+            self._last_reply = {
+                cid: entry for cid, entry in self._last_reply.items()
+                if now - entry[1] < _REPLY_DEDUP_TTL
+            }
+        self._last_reply[chat_id] = (text_hash, now)
+
+    async def _safe_reply_long(self, update: Update, text: str, **kwargs) -> bool:
+        """Ответ, который может не влезть в одно сообщение: отправляется частями по абзацам"""
+        chunks = _split_long_message(text)
+        last = len(chunks) - 1
+
+        success = True
+        for i, chunk in enumerate(chunks):
+            # Клавиатура и прочие параметры - только у последней части
+            sent = await self._safe_reply(update, chunk, **(kwargs if i == last else {}))
+            success = success and sent
+
+        return success
+
     async def _safe_reply_without_format(self, update: Update, text: str, **kwargs) -> bool:
         """Безопасный ответ на сообщение с учетом лимитов Telegram"""
         if not hasattr(self, 'application') or not self.application:
@@ -493,28 +813,104 @@ class FriendBot:
 
         return result
 
+    def _log(self, context: ContextTypes.DEFAULT_TYPE):
+        """Логгер, привязанный к пользователю чата (см. TelegramMiddleware.bind_logger)"""
+        if context.chat_data:
+            return context.chat_data.get('log', self.logger)
+        return self.logger
+
+    def _is_admin(self, user_id: int) -> bool:
+        """Проверка прав администратора с кэшированием на _ADMIN_CACHE_TTL секунд"""
+        now = time.monotonic()
+        cached = self._admin_cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        is_admin = self.manage_admin_uc.is_user_admin(user_id)
+
+        if len(self._admin_cache) >= _ADMIN_CACHE_MAX_SIZE:
+            self._admin_cache = {uid: entry for uid, entry in self._admin_cache.items() if entry[1] > now}
+            if len(self._admin_cache) >= _ADMIN_CACHE_MAX_SIZE:
+                self._admin_cache.clear()
+        self._admin_cache[user_id] = (is_admin, now + _ADMIN_CACHE_TTL)
+
+        return is_admin
+
+    async def _singleflight(self, key: tuple, func, *args, **kwargs):
+        """Выполнить блокирующий вызов в потоке, разделив результат между одновременными одинаковыми запросами"""
+        fut = self._inflight.get(key)
+        while fut is not None:
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # Отменен лидер, а не мы - выполняем запрос сами (или ждем нового лидера);
+                # cancelling() есть с Python 3.11 и ловит одновременную отмену и нас самих
+                task = asyncio.current_task()
+                if not fut.cancelled() or getattr(task, 'cancelling', lambda: 0)():
+                    raise
+            fut = self._inflight.get(key)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await asyncio.to_thread(func, *args, **kwargs)
+        except Exception as e:
+            fut.set_exception(e)
+            # Исключение уже пробрасывается вызывающему, ожидающих может не быть
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            # Отмена лидера (CancelledError не ловится выше) не должна оставлять ожидающих навсегда
+            if not fut.done():
+                fut.cancel()
+            self._inflight.pop(key, None)
+
+    async def _is_blocked(self, user_id: int) -> bool:
+        """Быстрая проверка блокировки по множеству ID, БД запрашивается только при попадании"""
+        now = time.monotonic()
+        if now >= self._blocked_ids_expiry:
+            self._blocked_ids = await self._singleflight(('blocked_ids',), self.manage_block_uc.get_blocked_user_ids)
+            self._blocked_ids_expiry = now + _BLOCKED_IDS_TTL
+
+        if user_id not in self._blocked_ids:
+            return False
+
+        if await asyncio.to_thread(self.manage_block_uc.is_user_blocked, user_id):
+            return True
+
+        self._blocked_ids.discard(user_id)
+        return False
+
+    async def _cached_listing(self, key: tuple, func, *args, **kwargs) -> str:
+        """Текст read-only админского списка с кэшем на _LISTING_CACHE_TTL секунд"""
+        now = time.monotonic()
+        cached = self._listing_cache.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        text = await self._singleflight(key, func, *args, **kwargs)
+
+        if len(self._listing_cache) >= _LISTING_CACHE_MAX_SIZE:
+            self._listing_cache.clear()
+        self._listing_cache[key] = (text, time.monotonic() + _LISTING_CACHE_TTL)
+
+        return text
+
     def _log_configuration(self):
+        ai_provider = os.getenv("AI_PROVIDER", "ollama")
         config_info = {
-            'ai_provider': os.getenv("AI_PROVIDER", "ollama"),
+            'ai_provider': ai_provider,
             'metrics_enabled': os.getenv("ENABLE_METRICS", "true"),
             'metrics_port': os.getenv("METRICS_PORT", "8000"),
             'log_level': os.getenv("LOG_LEVEL", "INFO"),
             'database_name': os.getenv("DB_NAME", "friend_bot.db")
         }
 
-        ai_provider = os.getenv("AI_PROVIDER", "ollama")
-        if ai_provider == "openai":
-            config_info['openai_model'] = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
-        elif ai_provider == "ollama":
-            config_info['ollama_model'] = os.getenv("OLLAMA_MODEL", "llama2:7b")
-            config_info['ollama_url'] = os.getenv("OLLAMA_URL", "http://localhost:11434")
-        elif ai_provider == "gemini":
-            config_info['gemini_model'] = os.getenv("GEMINI_MODEL", "gemini-pro")
-        elif ai_provider == "huggingface":
-            config_info['hf_model'] = os.getenv("HF_MODEL", "microsoft/DialoGPT-large")
-        elif ai_provider == "deepseek":
-            config_info['deepseek_model'] = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
-            config_info['deepseek_url'] = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+        for key, env_name, default in _PROVIDER_CONFIG.get(ai_provider, ()):
+            config_info[key] = os.getenv(env_name, default)
 
         self.logger.info("Application configuration", extra=config_info)
 
@@ -529,10 +925,7 @@ class FriendBot:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
 
-        self.logger.info(
-            "Start command received",
-            extra={'user_id': user.id, 'username': user.username}
-        )
+        self._log(context).info("Start command received")
 
         response = self.start_conversation_uc.execute(
             user.id, user.username, user.first_name, user.last_name,context.args
@@ -544,7 +937,7 @@ class FriendBot:
 
             success = await self._safe_reply(update, response)
             if not success:
-                self.logger.error(f"Failed to send start message to user {user.id}")
+                self.logger.error("Failed to send start message to user %s", user.id)
         else:
             # Приветственное сообщение
             welcome_msg = (
@@ -555,7 +948,7 @@ class FriendBot:
 
             success = await self._safe_reply(update, welcome_msg)
             if not success:
-                self.logger.error(f"Failed to send start message to user {user.id}")
+                self.logger.error("Failed to send start message to user %s", user.id)
 
              # Показываем карусель персонажей при старте
             await self.show_character_carousel(update)
@@ -563,7 +956,7 @@ class FriendBot:
     async def reset(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
 
-        self.logger.info("Reset command received", extra={'user_id': user_id})
+        self._log(context).info("Reset command received")
 
         # Получаем текущего персонажа пользователя
         character = self.manage_character_uc.get_user_character(user_id)
@@ -573,22 +966,22 @@ class FriendBot:
             self.rag_repo.delete_user_memories(user_id, character.id)
             self.manage_summary_uc.clear_summaries(user_id, character.id)
 
-            success = await self._safe_reply(update, f'🧹 Разговор с {character.name} сброшен! Давай начнем заново! Напиши что-нибудь.')
+            await self._safe_reply(update, f'🧹 Разговор с {character.name} сброшен! Давай начнем заново! Напиши что-нибудь.')
         else:
-            success = await self._safe_reply(update, '🧹 Давай начнем наш разговор заново! Сначала выбери персонажа с помощью /start')
+            await self._safe_reply(update, '🧹 Давай начнем наш разговор заново! Сначала выбери персонажа с помощью /start')
 
     async def limits(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать текущие лимиты пользователя"""
         user_id = update.effective_user.id
 
-        self.logger.info("Limits command received", extra={'user_id': user_id})
+        self._log(context).info("Limits command received")
 
         # Получаем тариф пользователя
         user_tariff = self.tariff_service.get_user_tariff(user_id)
         if not user_tariff or not user_tariff.tariff_plan:
-            success = await self._safe_reply(update,
-                                             "❌ Не удалось определить ваш тарифный план.\n"
-                                             "Используйте /start для инициализации.")
+            await self._safe_reply(update,
+                                   "❌ Не удалось определить ваш тарифный план.\n"
+                                   "Используйте /start для инициализации.")
             return
 
         tariff = user_tariff.tariff_plan
@@ -596,35 +989,38 @@ class FriendBot:
         # Получаем информацию о лимитах
         limits_info = self.check_limits_uc.get_limits_info(user_id, tariff)
 
-        message = f"📊 **Тариф: {tariff.name}**\n\n"
-        message += f"💰 Цена: {tariff.price} ⭐/30 дней\n\n"
-
-        message += "🕒 **Текущее использование:**\n"
-        message += f"• В минуту: {limits_info['current']['minute']}/{limits_info['limits']['minute']}\n"
-        message += f"• В час: {limits_info['current']['hour']}/{limits_info['limits']['hour']}\n"
-        message += f"• В день: {limits_info['current']['day']}/{limits_info['limits']['day']}\n\n"
-
-        message += "⏳ **Сброс через:**\n"
-        message += f"• Минута: {limits_info['time_until_reset']['minute']}\n"
-        message += f"• Час: {limits_info['time_until_reset']['hour']}\n"
-        message += f"• День: {limits_info['time_until_reset']['day']}\n\n"
-
-        message += "📏 **Лимиты сообщений:**\n"
-        message += f"• Макс. длина: {tariff.message_limits.max_message_length} символов\n"
-        message += f"• История: {tariff.message_limits.max_context_messages} сообщений\n"
-
-        message += "Лимиты защищают от перегрузки и помогают мне работать стабильно 💫"
+        current = limits_info['current']
+        limits = limits_info['limits']
+        reset = limits_info['time_until_reset']
+        message_limits = tariff.message_limits
+
+        message = (
+            f"📊 **Тариф: {tariff.name}**\n\n"
+            f"💰 Цена: {tariff.price} ⭐/30 дней\n\n"
+            "🕒 **Текущее использование:**\n"
+            f"• В минуту: {current['minute']}/{limits['minute']}\n"
+            f"• В час: {current['hour']}/{limits['hour']}\n"
+            f"• В день: {current['day']}/{limits['day']}\n\n"
+            "⏳ **Сброс через:**\n"
+            f"• Минута: {reset['minute']}\n"
+            f"• Час: {reset['hour']}\n"
+            f"• День: {reset['day']}\n\n"
+            "📏 **Лимиты сообщений:**\n"
+            f"• Макс. длина: {message_limits.max_message_length} символов\n"
+            f"• История: {message_limits.max_context_messages} сообщений\n"
+            "Лимиты защищают от перегрузки и помогают мне работать стабильно 💫"
+        )
 
         success = await self._safe_reply(update, message)
         if not success:
-            self.logger.error(f"Failed to send limits to user {user_id}")
+            self.logger.error("Failed to send limits to user %s", user_id)
 
     async def tariff(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать информацию о моем тарифном плане"""
         user = update.effective_user
         user_id = user.id
 
-        self.logger.info("My tariff command received", extra={'user_id': user_id})
+        self._log(context).info("My tariff command received")
 
         keyboard = []
 
@@ -651,12 +1047,13 @@ class FriendBot:
 
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        response = self.manage_tariff_uc.get_user_tariff_info(user_id)
+        response = await asyncio.to_thread(self.manage_tariff_uc.get_user_tariff_info, user_id)
 
-        success = await self._safe_reply(update, response, reply_markup=reply_markup)
+        success = await self._safe_reply_long(update, response, reply_markup=reply_markup)
         if not success:
-            self.logger.error(f"Failed to send tariff info to user {user_id}")
+            self.logger.error("Failed to send tariff info to user %s", user_id)
 
+    @serialized_per_user
     async def handle_pay_premium_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
@@ -701,7 +1098,7 @@ class FriendBot:
             payload=invoice_payload
         )
         if payment_id == 0:
-            self.logger.error(f"Failed to create payment record for user {user_id}")
+            self.logger.error("Failed to create payment record for user %s", user_id)
 
         invoice_payload = f"{invoice_payload}_{payment_id}"
 
@@ -725,10 +1122,10 @@ class FriendBot:
                 prices=prices,
             )
 
-            self.logger.info(f"Invoice created for user {user_id}: premium triff with payload {invoice_payload}")
+            self.logger.info("Invoice created for user %s: premium triff with payload %s", user_id, invoice_payload)
 
         except Exception as e:
-            self.logger.error(f"Failed to create invoice: {e}")
+            self.logger.error("Failed to create invoice: %s", e)
             await query.edit_message_text(
                 "❌ Не удалось создать счет для оплаты. Попробуйте позже.",
                 reply_markup=None
@@ -744,33 +1141,35 @@ class FriendBot:
 
             self.logger.info("handle_successful_payment called", extra={'pre_checkout_query': pre_checkout_query})
 
-            if not payload.startswith('payment_'):
-                self.logger.warning(f'Invalid payload format: {payload}')
-                await query.answer(ok=False, error_message="Произошла ошибка обработки платежа. Попробуйте позже.")
+            match = _PAYMENT_PAYLOAD_RE.fullmatch(payload)
+            if not match:
+                self.logger.warning('Invalid payload format: %s', payload)
+                await query.answer(ok=False, error_message=_MSG_PAYMENT_FAILED)
                 return None
 
             try:
-                payload_array = payload.split('_')
-                duration, user_id, tariff_plan_id = int(payload_array[1]), int(payload_array[2]), int(payload_array[3])
+                duration, user_id, tariff_plan_id = int(match[1]), int(match[2]), int(match[3])
 
-                success, message = self.manage_tariff_uc.assign_tariff_to_user(user_id, tariff_plan_id, duration_seconds=duration*86400)
+                success, message = await asyncio.to_thread(
+                    self.manage_tariff_uc.assign_tariff_to_user, user_id, tariff_plan_id, duration_seconds=duration*86400
+                )
                 if success:
-                    self.logger.info(f"Successful payment, assigned tariff '{tariff_plan_id}' to user {user_id} on {duration} days")
+                    self.logger.info("Successful payment, assigned tariff '%s' to user %s on %s days", tariff_plan_id, user_id, duration)
                     await query.answer(ok=True)
-                    self.logger.info(f'Pre-checkout query approved: {query.id}')
+                    self.logger.info('Pre-checkout query approved: %s', query.id)
                 else:
-                    await query.answer(ok=False, error_message="Произошла ошибка обработки платежа. Попробуйте позже.")
+                    await query.answer(ok=False, error_message=_MSG_PAYMENT_FAILED)
 
             except Exception as e:
-                self.logger.error(f'Error handling successful payment: {e}')
-                await query.answer(ok=False, error_message="Произошла ошибка обработки платежа. Попробуйте позже.")
+                self.logger.error('Error handling successful payment: %s', e)
+                await query.answer(ok=False, error_message=_MSG_PAYMENT_FAILED)
                 return None
 
             return None
 
         except Exception as e:
-            self.logger.error(f'Error handling successful payment: {e}')
-            await query.answer(ok=False, error_message="Произошла ошибка обработки платежа. Попробуйте позже.")
+            self.logger.error('Error handling successful payment: %s', e)
+            await query.answer(ok=False, error_message=_MSG_PAYMENT_FAILED)
             return None
 
     async def handle_successful_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -780,12 +1179,16 @@ class FriendBot:
         message = update.effective_message
 
         successful_payment = message.successful_payment
-        payload = successful_payment.invoice_payload
         if not successful_payment:
             return None
 
-        payload_array = payload.split('_')
-        tariff_plan_id, payment_id  = int(payload_array[3]), int(payload_array[4])
+        payload = successful_payment.invoice_payload
+        match = _PAYMENT_PAYLOAD_RE.fullmatch(payload)
+        if not match:
+            self.logger.error('Invalid payload format: %s', payload)
+            return False
+
+        tariff_plan_id, payment_id = int(match[3]), int(match[4])
 
         # Обновляем запись в БД
         success = self.payment_repo.update_payment_success(
@@ -794,13 +1197,13 @@ class FriendBot:
             provider_payment_charge_id=successful_payment.provider_payment_charge_id
         )
         if success:
-            self.logger.info(f"Payment succeeded for payment_id {payment_id}")
+            self.logger.info("Payment succeeded for payment_id %s", payment_id)
 
             # Метрика: успешный платёж
             if tariff_plan_id:
                 metrics_collector.record_payment_completed(tariff_plan_id)
         else:
-            self.logger.warning(f"Payment record not found or already updated for payload {payload}")
+            self.logger.warning("Payment record not found or already updated for payload %s", payload)
 
         escaped_text = MarkdownFormatter.format_text(response, ParseMode.MARKDOWN_V2)
         await update.effective_message.reply_text(
@@ -810,321 +1213,189 @@ class FriendBot:
 
         return True
 
+    @admin_only
     async def admin_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать список пользователей"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
         # Парсим параметры (номер страницы)
         page = 1
-        if context.args:
-            try:
-                page = int(context.args[0])
-                if page < 1:
-                    page = 1
-            except ValueError:
-                success = await self._safe_reply(update, "❌ Неверный формат номера страницы")
+        args = context.args
+        if args:
+            page = _parse_int_arg(args[0])
+            if page is None:
+                await self._safe_reply(update, "❌ Неверный формат номера страницы")
                 return
+            page = max(page, 1)
 
         # Получаем список пользователей
-        message = self.manage_admin_uc.get_users_list(page=page)
-        success = await self._safe_reply(update, message)
+        message = await self._cached_listing(('users_list', page), self.manage_admin_uc.get_users_list, page=page)
+        success = await self._safe_reply_long(update, message)
         if not success:
-            self.logger.error(f"Failed to send admin users list to user {user_id}")
+            self.logger.error("Failed to send admin users list to user %s", user_id)
 
+    @admin_only
     async def admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статистику пользователей"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        message = self.manage_admin_uc.get_user_stats()
+        message = await self._cached_listing(('admin_stats',), self.manage_admin_uc.get_user_stats)
         success = await self._safe_reply(update, message)
         if not success:
-            self.logger.error(f"Failed to send admin stats to user {user_id}")
+            self.logger.error("Failed to send admin stats to user %s", user_id)
 
-    async def admin_userinfo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg()
+    async def admin_userinfo(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Показать информацию о пользователе"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        # Проверяем аргументы
-        if not context.args:
-            # Если аргументов нет, показываем информацию о себе
-            target_user_id = user_id
-        else:
-            try:
-                target_user_id = int(context.args[0])
-            except ValueError:
-                success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
-                return
-
-        message = self.manage_admin_uc.get_user_info(target_user_id)
+        message = await asyncio.to_thread(self.manage_admin_uc.get_user_info, target_user_id)
         success = await self._safe_reply(update, message)
         if not success:
-            self.logger.error(f"Failed to send user info to user {user_id}")
+            self.logger.error("Failed to send user info to user %s", user_id)
 
+    @admin_only
     async def admin_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать справку по административным командам"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        help_text = """
-    👑 **Административные команды:**
-
-    📋 **Списки и информация:**
-    • `/admin_users [страница]` - список всех пользователей
-    • `/admin_blocked_list` - список заблокированных
-
-    📊 **Статистика и информация:**
-    • `/admin_stats` - общая статистика пользователей
-    • `/admin_userinfo [user_id]` - информация о пользователе
-    • `/admin_message_stats [user_id]` - статистика сообщений
-    • `/admin_user_tariff [user_id]` - тариф пользователя
-
-    🚫 **Управление блокировками:**
-    • `/admin_block <user_id> [причина]` - заблокировать пользователя
-    • `/admin_unblock <user_id>` - разблокировать пользователя
-    • `/admin_blocked_list` - список заблокированных
-    • `/admin_block_info <user_id>` - информация о блокировке
-
-     **Примеры использования:**
-    `/admin_message_stats 123456789` - статистика сообщений
-
-    💡 **Примеры использования:**
-    `/admin_user_tariff 123456789` - посмотреть тариф пользователя
-
-    📊 **Обычные команды (для всех):**
-    • `/start` - начать общение
-    • `/limits` - лимиты сообщений
-    • `/reset` - сбросить разговор
-    • `/tariff` - твой тариф
-    • `/all_tariffs` - все тарифы
-    • `/tariff_info <ID>` - информация о тарифе
-        """
-        success = await self._safe_reply(update, help_text)
+        success = await self._safe_reply(update, _ADMIN_HELP_TEXT, escaped=True)
         if not success:
-            self.logger.error(f"Failed to send admin help to user {user_id}")
+            self.logger.error("Failed to send admin help to user %s", user_id)
 
-    async def admin_block(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg(_ADMIN_BLOCK_USAGE)
+    async def admin_block(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Заблокировать пользователя"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        # Проверяем аргументы
-        if not context.args:
-            success = await self._safe_reply(update,
-                                             "❌ Использование: /admin_block <user_id> [причина]\n\n"
-                                             "Пример:\n"
-                                             "/admin_block 123456789 Нарушение правил\n"
-                                             "/admin_block 987654321"
-                                             )
-            return
-
-        try:
-            target_user_id = int(context.args[0])
-            reason = ' '.join(context.args[1:]) if len(context.args) > 1 else None
-
-            success, message = self.manage_block_uc.block_user(target_user_id, user_id, reason)
-            await self._safe_reply(update, message)
+        reason = ' '.join(context.args[1:]) or None
 
-        except ValueError:
-            success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
+        success, message = await asyncio.to_thread(self.manage_block_uc.block_user, target_user_id, user_id, reason)
+        if success:
+            self._blocked_ids.add(target_user_id)
+            self._listing_cache.clear()
+        await self._safe_reply(update, message)
 
-    async def admin_unblock(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg("❌ Укажите ID пользователя: /admin_unblock <user_id>")
+    async def admin_unblock(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Разблокировать пользователя"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        # Проверяем аргументы
-        if not context.args:
-            success = await self._safe_reply(update, "❌ Укажите ID пользователя: /admin_unblock <user_id>")
-            return
-
-        try:
-            target_user_id = int(context.args[0])
-            success, message = self.manage_block_uc.unblock_user(target_user_id, user_id)
-            await self._safe_reply(update, message)
-
-        except ValueError:
-            success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
+        success, message = await asyncio.to_thread(self.manage_block_uc.unblock_user, target_user_id, user_id)
+        if success:
+            self._blocked_ids.discard(target_user_id)
+            self._listing_cache.clear()
+        await self._safe_reply(update, message)
 
+    @admin_only
     async def admin_blocked_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать список заблокированных пользователей"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        message = self.manage_block_uc.get_blocked_list()
+        message = await self._cached_listing(('blocked_list',), self.manage_block_uc.get_blocked_list)
         success = await self._safe_reply(update, message)
         if not success:
-            self.logger.error(f"Failed to send blocked list to user {user_id}")
+            self.logger.error("Failed to send blocked list to user %s", user_id)
 
-    async def admin_block_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg("❌ Укажите ID пользователя: /admin_block_info <user_id>")
+    async def admin_block_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Показать информацию о блокировке пользователя"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        # Проверяем аргументы
-        if not context.args:
-            success = await self._safe_reply(update, "❌ Укажите ID пользователя: /admin_block_info <user_id>")
-            return
-
-        try:
-            target_user_id = int(context.args[0])
-            message = self.manage_block_uc.get_block_info(target_user_id)
-            success = await self._safe_reply(update, message)
-            if not success:
-                self.logger.error(f"Failed to send block info to user {user_id}")
-
-        except ValueError:
-            success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
+        message = await asyncio.to_thread(self.manage_block_uc.get_block_info, target_user_id)
+        success = await self._safe_reply(update, message)
+        if not success:
+            self.logger.error("Failed to send block info to user %s", user_id)
 
-    async def admin_message_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg()
+    async def admin_message_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Показать статистику сообщений пользователя"""
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        # Проверяем аргументы
-        if not context.args:
-            # Если аргументов нет, показываем свою статистику
-            target_user_id = user_id
-        else:
-            try:
-                target_user_id = int(context.args[0])
-            except ValueError:
-                success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
-                return
-
         # Получаем статистику через обновленный use case
-        stats = self.manage_user_limits_uc.get_user_stats(target_user_id)
+        stats = await asyncio.to_thread(self.manage_user_limits_uc.get_user_stats, target_user_id)
 
         # Получаем тариф пользователя для отображения лимитов
-        user_tariff = self.tariff_service.get_user_tariff(target_user_id)
+        user_tariff = await asyncio.to_thread(self.tariff_service.get_user_tariff, target_user_id)
         tariff_info = None
         if user_tariff and user_tariff.tariff_plan:
             tariff_info = self.manage_user_limits_uc.get_tariff_limits_info(user_tariff.tariff_plan)
 
-        message = f"📊 **Статистика сообщений пользователя {target_user_id}:**\n\n"
-        message += f"• Всего сообщений: {stats['total_messages']}\n"
-        message += f"• Всего символов: {stats['total_characters']}\n"
-        message += f"• Средняя длина: {stats['average_length']} символов\n"
-        message += f"• Отклонено сообщений: {stats['rejected_messages']}\n"
-        message += f"• Попаданий в rate limit: {stats['rate_limit_hits']}\n"
+        lines = [
+            f"📊 **Статистика сообщений пользователя {target_user_id}:**\n",
+            f"• Всего сообщений: {stats['total_messages']}",
+            f"• Всего символов: {stats['total_characters']}",
+            f"• Средняя длина: {stats['average_length']} символов",
+            f"• Отклонено сообщений: {stats['rejected_messages']}",
+            f"• Попаданий в rate limit: {stats['rate_limit_hits']}",
+        ]
 
-        if stats['last_message_at']:
-            from datetime import datetime
-            last_msg = stats['last_message_at']
+        last_msg = stats['last_message_at']
+        if last_msg:
             if isinstance(last_msg, str):
                 last_msg = datetime.fromisoformat(last_msg.replace('Z', '+00:00'))
-            message += f"• Последнее сообщение: {last_msg.strftime('%d.%m.%Y %H:%M')}\n"
+            lines.append(f"• Последнее сообщение: {last_msg.strftime('%d.%m.%Y %H:%M')}")
 
         if tariff_info:
-            message += "\n📏 **Лимиты тарифа:**\n"
-            message += f"• Макс. длина сообщения: {tariff_info['message_limits']['max_message_length']}\n"
-            message += f"• Макс. сообщений в контексте: {tariff_info['message_limits']['max_context_messages']}\n"
+            message_limits = tariff_info['message_limits']
+            lines.append("\n📏 **Лимиты тарифа:**")
+            lines.append(f"• Макс. длина сообщения: {message_limits['max_message_length']}")
+            lines.append(f"• Макс. сообщений в контексте: {message_limits['max_context_messages']}")
 
-        success = await self._safe_reply(update, message)
+        success = await self._safe_reply(update, "\n".join(lines) + "\n")
         if not success:
-            self.logger.error(f"Failed to send message stats to user {user_id}")
+            self.logger.error("Failed to send message stats to user %s", user_id)
 
+    @admin_only
     async def admin_health(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
 
-        # Проверяем права администратора
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        self.logger.info("Health check requested", extra={'user_id': user_id})
+        self._log(context).info("Health check requested")
 
-        health_status = self.health_checker.perform_health_check()
+        health_status = await self.health_checker.perform_health_check_async()
 
-        status_emoji = "🟢" if health_status.status == "healthy" else "🟡" if health_status.status == "degraded" else "🔴"
+        status_emoji = _STATUS_EMOJI.get(health_status.status, "🔴")
 
-        response = f"{status_emoji} **System Health: {health_status.status.upper()}**\n\n"
+        response_parts = [f"{status_emoji} **System Health: {health_status.status.upper()}**\n\n"]
 
         for check_name, details in health_status.details.items():
-            check_emoji = "✅" if details.get('status') == 'healthy' else "⚠️" if details.get(
-                'status') == 'degraded' else "❌"
-            response += f"{check_emoji} **{check_name}**: {details.get('status', 'unknown')}\n"
+            status = details.get('status', 'unknown')
+            response_parts.append(f"{_CHECK_EMOJI.get(status, '❌')} **{check_name}**: {status}\n")
+
+        response = "".join(response_parts)
 
         success = await self._safe_reply(update, response)
         if not success:
-            self.logger.error(f"Failed to send health status to user {user_id}")
+            self.logger.error("Failed to send health status to user %s", user_id)
 
-    async def admin_user_tariff(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    @admin_only
+    @target_user_arg()
+    async def admin_user_tariff(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target_user_id: int):
         """Показать тариф пользователя"""
         user_id = update.effective_user.id
 
-        if not self.manage_admin_uc.is_user_admin(user_id):
-            success = await self._safe_reply(update, "❌ Эта команда доступна только администраторам")
-            return
-
-        if not context.args:
-            # Если аргументов нет, показываем свой тариф
-            target_user_id = user_id
-        else:
-            try:
-                target_user_id = int(context.args[0])
-            except ValueError:
-                success = await self._safe_reply(update, "❌ Неверный формат ID пользователя")
-                return
-
-        message = self.manage_tariff_uc.get_user_tariff_info(target_user_id)
+        message = await asyncio.to_thread(self.manage_tariff_uc.get_user_tariff_info, target_user_id)
         success = await self._safe_reply(update, message)
         if not success:
-            self.logger.error(f"Failed to send user tariff info to user {user_id}")
+            self.logger.error("Failed to send user tariff info to user %s", user_id)
 
+    @serialized_per_user
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         user_id = user.id
         user_message = update.message.text
 
-        self.logger.info(
-            "Message received",
-            extra={'user_id': user_id, 'message_length': len(user_message)}
-        )
+        log = self._log(context)
+        if log.isEnabledFor(logging.INFO):
+            log.info("Message received", extra={'message_length': len(user_message)})
 
-        if self.manage_block_uc.is_user_blocked(user_id):
-            success = await self._safe_reply(update,
-                                             "🚫 Вы заблокированы и не можете отправлять сообщения.\n\n"
-                                             "Если вы считаете, что это ошибка, свяжитесь с администратором."
-                                             )
+        if await self._is_blocked(user_id):
+            await self._safe_reply(update, _MSG_BLOCKED, escaped=True)
             return
 
         self.user_repo.update_last_seen(user_id)
@@ -1142,9 +1413,9 @@ class FriendBot:
         user_tariff = self.tariff_service.get_user_tariff(user_id)
 
         if not user_tariff or not user_tariff.tariff_plan:
-            success = await self._safe_reply(update,
-                                             "❌ Не удалось определить ваш тарифный план.\n"
-                                             "Пожалуйста, свяжитесь с администратором.")
+            await self._safe_reply(update,
+                                   "❌ Не удалось определить ваш тарифный план.\n"
+                                   "Пожалуйста, свяжитесь с администратором.")
             return
 
         if user_tariff.is_expired():
@@ -1198,7 +1469,7 @@ class FriendBot:
 
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            success = await self._safe_reply(update, message_paywall, reply_markup=reply_markup)
+            await self._safe_reply(update, message_paywall, reply_markup=reply_markup)
 
             return
 
@@ -1208,28 +1479,20 @@ class FriendBot:
             user_id, user_message, tariff
         )
         if not is_valid:
-            success = await self._safe_reply(update, error_msg)
+            await self._safe_reply(update, error_msg)
             return
 
-        if not self.manage_admin_uc.is_user_admin(user_id):
+        if not self._is_admin(user_id):
             can_send, limit_message, _ = self.check_limits_uc.check_rate_limit(user_id, tariff)
             if not can_send:
-                success = await self._safe_reply(update, limit_message)
+                await self._safe_reply(update, limit_message)
                 return
 
         try:
             await self._send_typing_status(user_id)
 
-            # Сохраняем пользователя (если еще не сохранен)
-            existing_user = self.user_repo.get_user(user_id)
-            if not existing_user:
-                self.user_repo.save_user(
-                    self.middleware.create_user_from_telegram(user)
-                )
-
-            if existing_user:
-                existing_user.reset_proactive_state()
-                self.user_repo.save_user(existing_user)
+            # Сохраняем пользователя (если еще не сохранен) и сбрасываем состояние проактива одним запросом
+            self.user_repo.upsert_user_activity(self.middleware.create_user_from_telegram(user))
 
             await self._send_typing_status(user_id)
 
@@ -1245,44 +1508,18 @@ class FriendBot:
 
             success = await self._safe_reply_without_format(update, response)
             if not success:
-                self.logger.error(f"Failed to send response to user {user_id}")
+                self.logger.error("Failed to send response to user %s", user_id)
 
         except Exception as e:
-            self.logger.error(
-                f"Error handling message: {e}",
-                extra={'user_id': user_id, 'operation': 'handle_message'}
-            )
-            success = await self._safe_reply(update,
-                                             "😔 Извини, у меня небольшие технические проблемы. Можешь повторить?")
+            log.error("Error handling message: %s", e, extra={'operation': 'handle_message'})
+            success = await self._safe_reply(update, _MSG_TECH_PROBLEM, escaped=True)
             if not success:
-                self.logger.error(f"Failed to send error message to user {user_id}")
+                self.logger.error("Failed to send error message to user %s", user_id)
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_text = """
-        
-Команды:
-/start - начать общение
-/info - текущая история
-/reset - сбросить разговор
-/premium - перейти на премиум
-/help - помощь
-
-Я запомню:
-• Как тебя зовут
-• Твой возраст
-• Твои интересы
-• Твое настроение
-
-Просто напиши что-то вроде:
-"Меня зовут Анна, мне 25 лет"
-"Я люблю читать и гулять в парке"
-"Мне сегодня грустно"
-
-По всем возникающим вопросам пишете в техподдержку: @youraigirls_manager 
-        """
-        success = await self._safe_reply(update, help_text)
+        success = await self._safe_reply(update, _HELP_TEXT, escaped=True)
         if not success:
-            self.logger.error(f"Failed to send help to user {update.effective_user.id}")
+            self.logger.error("Failed to send help to user %s", update.effective_user.id)
 
     async def info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -1291,14 +1528,14 @@ class FriendBot:
         user = update.effective_user
         user_id = user.id
 
-        self.logger.info('Info command received', extra={'user_id': user_id})
+        self._log(context).info('Info command received')
 
         # Получаем текущего персонажа пользователя
         character = self.manage_character_uc.get_user_character(user_id)
 
         if not character:
             # Если персонаж не выбран, предлагаем выбрать
-            success = await self._safe_reply(
+            await self._safe_reply(
                 update,
                 '👤 **У вас еще не выбран персонаж!**\n\n'
                 'Используйте /start для выбора персонажа.'
@@ -1323,38 +1560,19 @@ class FriendBot:
 
             if not success:
                 # Если не удалось отправить фото, отправляем только текст
-                success = await self._safe_reply(update, message)
+                await self._safe_reply(update, message)
         except Exception as e:
-            self.logger.error(f"Error sending character photo: {e}")
-            success = await self._safe_reply(update, message)
+            self.logger.error("Error sending character photo: %s", e)
+            await self._safe_reply(update, message)
 
     def setup_handlers(self):
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler('info', self.info))
-        self.application.add_handler(CommandHandler("reset", self.reset))
-        # self.application.add_handler(CommandHandler("limits", self.limits))
-        self.application.add_handler(CommandHandler("premium", self.tariff))
-
-        self.application.add_handler(CommandHandler("help", self.help))
-
-        # Административные команды
-        self.application.add_handler(CommandHandler("admin_users", self.admin_users))
-        self.application.add_handler(CommandHandler("admin_help", self.admin_help))
-        self.application.add_handler(CommandHandler("admin_stats", self.admin_stats))
-        self.application.add_handler(CommandHandler("admin_userinfo", self.admin_userinfo))
-        self.application.add_handler(CommandHandler("admin_health", self.admin_health))
+        # Привязка логгера к пользователю до всех остальных обработчиков
+        self.application.add_handler(TypeHandler(Update, self.middleware.bind_logger), group=-1)
 
-        # Команды блокировки
-        self.application.add_handler(CommandHandler("admin_block", self.admin_block))
-        self.application.add_handler(CommandHandler("admin_unblock", self.admin_unblock))
-        self.application.add_handler(CommandHandler("admin_blocked_list", self.admin_blocked_list))
-        self.application.add_handler(CommandHandler("admin_block_info", self.admin_block_info))
-
-        # Команды управления лимитами сообщений
-        self.application.add_handler(CommandHandler("admin_message_stats", self.admin_message_stats))
-
-        # Команды управления тарифами
-        self.application.add_handler(CommandHandler("admin_user_tariff", self.admin_user_tariff))
+        # Пользовательские команды и административные /admin_<name> -> self.admin_<name>
+        commands = _USER_COMMANDS + tuple((f"admin_{name}", f"admin_{name}") for name in _ADMIN_COMMANDS)
+        self._command_map = {command: getattr(self, method) for command, method in commands}
+        self.application.add_handler(MessageHandler(filters.COMMAND, self._dispatch_command))
 
         # Обработчик карусели персонажей
         self.application.add_handler(CallbackQueryHandler(
@@ -1379,6 +1597,23 @@ class FriendBot:
 
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
 
+    @serialized_per_user
+    async def _dispatch_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Один обработчик на все команды: поиск в словаре вместо перебора CommandHandler на каждый апдейт"""
+        command, *args = update.effective_message.text.split()
+        command, _, bot_name = command[1:].partition('@')
+        if bot_name and bot_name.lower() != context.bot.username.lower():
+            # Команда адресована другому боту в группе
+            return
+
+        handler = self._command_map.get(command.lower())
+        if handler is None:
+            return
+
+        # Как и CommandHandler, передаем аргументы команды через context.args
+        context.args = args
+        await handler(update, context)
+
     async def cleanup(self):
         """Корректное завершение работы"""
         self.logger.info("Cleaning up resources...")
@@ -1390,8 +1625,16 @@ class FriendBot:
             except asyncio.CancelledError:
                 pass
 
+        # Останавливаем фоновую запись, остаток очереди дописывается в БД
+        if self._write_batcher_task:
+            self._write_batcher_task.cancel()
+            try:
+                await self._write_batcher_task
+            except asyncio.CancelledError:
+                pass
+
         # Закрываем AI клиенты
-        if hasattr(self, 'ai_client'):
+        if self.ai_client:
             await self.ai_client.close()
 
         self.logger.info("Cleanup completed")
@@ -1406,7 +1649,12 @@ class FriendBot:
                 .read_timeout(15.0)
                 .write_timeout(15.0)
                 .pool_timeout(15.0)
-                .post_init(self._start_proactive_worker)
+                # Пул соединений к Bot API под параллельную обработку обновлений: TCP/TLS переиспользуются
+                .connection_pool_size(int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", "256")))
+                # Медленный ответ AI одному пользователю не задерживает обработку остальных
+                .concurrent_updates(int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", "32")))
+                .post_init(self._post_init)
+                .post_shutdown(self._post_shutdown)
                 .build()
             )
 
@@ -1420,22 +1668,26 @@ class FriendBot:
                 }
             )
 
-            # Регистрируем обработчик завершения
-            import signal
-            import functools
-
-            def signal_handler(signum, frame):
-                self.logger.info(f"Received signal {signum}, shutting down...")
-                # Создаем асинхронную задачу для cleanup
-                loop = asyncio.get_event_loop()
-                asyncio.create_task(self.cleanup())
-
-            signal.signal(signal.SIGINT, signal_handler)  # Ctrl+C
-            signal.signal(signal.SIGTERM, signal_handler)  # systemd stop
-
-            self.application.run_polling(timeout=30)
+            # SIGINT/SIGTERM обрабатывает сам PTB (loop.add_signal_handler в run_polling/run_webhook):
+            # он останавливает приложение и вызывает post_shutdown -> cleanup внутри event loop
+
+            webhook_url = os.getenv("TELEGRAM_WEBHOOK_URL")
+            if webhook_url:
+                # Webhook: Telegram сам присылает обновления, без цикла getUpdates
+                secret = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+                url_path = os.getenv("TELEGRAM_WEBHOOK_PATH") or secret or "telegram"
+                self.logger.info("Starting in webhook mode", extra={'webhook_url': webhook_url})
+                self.application.run_webhook(
+                    listen=os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0"),
+                    port=int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443")),
+                    url_path=url_path,
+                    webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+                    secret_token=secret
+                )
+            else:
+                self.application.run_polling(timeout=30)
 
         except Exception as e:
-            self.logger.error(f"Failed to start bot: {e}")
+            self.logger.error("Failed to start bot: %s", e)
             asyncio.run(self.cleanup())
             raise
\ No newline at end of file
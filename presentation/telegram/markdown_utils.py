@@ -3,7 +3,6 @@
 Версия 2 Markdown требует экранирования специальных символов.
 """
 from typing import Optional, List, Tuple
-from telegram.helpers import escape_markdown
 from telegram.constants import ParseMode
 import re
 
@@ -19,6 +18,32 @@ class MarkdownFormatter:
     ITALIC_PATTERN = r'_(?!\s)(.+?)(?<!\s)_'
     CODE_PATTERN = r'`(?!\s)(.+?)(?<!\s)`'
 
+    # Все виды разметки одним проходом: имя группы задает разделитель.
+    # **жирный** (старый синтаксис Markdown) проверяется первым и выводится как *жирный*
+    _MARKUP_RE = re.compile(
+        r'\*\*(?!\s)(?P<strong>.+?)(?<!\s)\*\*'
+        r'|\*(?!\s)(?P<bold>.+?)(?<!\s)\*'
+        r'|_(?!\s)(?P<italic>.+?)(?<!\s)_'
+        r'|`(?!\s)(?P<code>.+?)(?<!\s)`',
+        re.DOTALL
+    )
+    _DELIMITER_CHARS = frozenset('*_`')
+
+    # Таблица для str.translate: символ -> \символ
+    _ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in MD_V2_SPECIAL_CHARS})
+
+    # Разделители разметки при сборке подставляются символами из Private Use Area,
+    # чтобы весь результат экранировался одним translate и они не получили обратный слэш
+    _PLACEHOLDERS = {'*': '\ue000', '_': '\ue001', '`': '\ue002'}
+    _DELIMITERS = {'strong': '\ue000', 'bold': '\ue000', 'italic': '\ue001', 'code': '\ue002'}
+    _PLACEHOLDER_CHARS = frozenset(_PLACEHOLDERS.values())
+    _ASSEMBLE_TABLE = {**_ESCAPE_TABLE, **{ord(p): d for d, p in _PLACEHOLDERS.items()}}
+    _STRIP_PLACEHOLDERS_TABLE = dict.fromkeys(map(ord, _PLACEHOLDER_CHARS))
+
+    # HTML-сущности: одна замена через translate вместо пяти проходов replace
+    _HTML_ESCAPE_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'})
+    _HTML_SPECIAL_CHARS = frozenset('&<>"\'')
+
     @staticmethod
     def format_text(text: str, parse_mode: Optional[str] = None) -> str:
         """
@@ -39,88 +64,54 @@ class MarkdownFormatter:
     def _format_markdown_v2_smart(text: str) -> str:
         """
         Умное форматирование MarkdownV2:
-        1. Находит все элементы разметки
-        2. Экранирует содержимое внутри разметки
-        3. Собирает обратно
+        1. Находит элементы разметки за один проход по тексту
+        2. Собирает текст, заменяя разделители разметки плейсхолдерами
+        3. Экранирует результат целиком одним translate, возвращая разделители
         """
-        # Находим все элементы разметки с их позициями
-        elements = []
-
-        # Ищем жирный текст
-        for match in re.finditer(MarkdownFormatter.BOLD_PATTERN, text, re.DOTALL):
-            start, end = match.span()
-            content = match.group(1)
-            # Экранируем содержимое
-            escaped_content = MarkdownFormatter._escape_all_special_chars(content)
-            elements.append(('bold', start, end, escaped_content))
-
-        # Ищем курсив
-        for match in re.finditer(MarkdownFormatter.ITALIC_PATTERN, text, re.DOTALL):
-            start, end = match.span()
-            content = match.group(1)
-            escaped_content = MarkdownFormatter._escape_all_special_chars(content)
-            elements.append(('italic', start, end, escaped_content))
-
-        # Ищем код
-        for match in re.finditer(MarkdownFormatter.CODE_PATTERN, text, re.DOTALL):
-            start, end = match.span()
-            content = match.group(1)
-            escaped_content = MarkdownFormatter._escape_all_special_chars(content)
-            elements.append(('code', start, end, escaped_content))
-
-        # Если нет разметки, просто экранируем весь текст
-        if not elements:
+        # Большинство ответов без разметки: регулярное выражение не нужно
+        if MarkdownFormatter._DELIMITER_CHARS.isdisjoint(text):
             return MarkdownFormatter._escape_all_special_chars(text)
 
-        # Сортируем элементы по позиции
-        elements.sort(key=lambda x: x[1])
+        if not MarkdownFormatter._PLACEHOLDER_CHARS.isdisjoint(text):
+            text = text.translate(MarkdownFormatter._STRIP_PLACEHOLDERS_TABLE)
+
+        delimiters = MarkdownFormatter._DELIMITERS
 
-        # Собираем результат
         result = []
         last_pos = 0
 
-        for elem_type, start, end, content in elements:
-            # Добавляем текст перед элементом (экранированный)
+        for match in MarkdownFormatter._MARKUP_RE.finditer(text):
+            start, end = match.span()
+            # Текст перед элементом
             if start > last_pos:
-                plain_text = text[last_pos:start]
-                escaped_plain = MarkdownFormatter._escape_all_special_chars(plain_text)
-                result.append(escaped_plain)
-
-            # Добавляем элемент с экранированным содержимым
-            if elem_type == 'bold':
-                result.append(f'*{content}*')
-            elif elem_type == 'italic':
-                result.append(f'_{content}_')
-            elif elem_type == 'code':
-                result.append(f'`{content}`')
+                result.append(text[last_pos:start])
+
+            delimiter = delimiters[match.lastgroup]
+            result += (delimiter, match.group(match.lastgroup), delimiter)
 
             last_pos = end
 
-        # Добавляем оставшийся текст после последнего элемента
-        if last_pos < len(text):
-            plain_text = text[last_pos:]
-            escaped_plain = MarkdownFormatter._escape_all_special_chars(plain_text)
-            result.append(escaped_plain)
+        # Если нет разметки, просто экранируем весь текст
+        if not last_pos:
+            return MarkdownFormatter._escape_all_special_chars(text)
 
-        return ''.join(result)
+        # Оставшийся текст после последнего элемента
+        result.append(text[last_pos:])
+
+        return ''.join(result).translate(MarkdownFormatter._ASSEMBLE_TABLE)
 
     @staticmethod
     def _escape_all_special_chars(text: str) -> str:
         """Экранирует все специальные символы MarkdownV2."""
-        for char in MarkdownFormatter.MD_V2_SPECIAL_CHARS:
-            # Экранируем каждый специальный символ
-            text = text.replace(char, f'\\{char}')
-        return text
+        return text.translate(MarkdownFormatter._ESCAPE_TABLE)
 
     @staticmethod
     def _escape_html(text: str) -> str:
         """Экранирует HTML-сущности."""
-        text = text.replace('&', '&amp;')
-        text = text.replace('<', '&lt;')
-        text = text.replace('>', '&gt;')
-        text = text.replace('"', '&quot;')
-        text = text.replace("'", '&#39;')
-        return text
+        # Обычно в ответе нет ни одного спецсимвола - возвращаем текст как есть
+        if MarkdownFormatter._HTML_SPECIAL_CHARS.isdisjoint(text):
+            return text
+        return text.translate(MarkdownFormatter._HTML_ESCAPE_TABLE)
 
     @staticmethod
     def format_bold(text: str) -> str:
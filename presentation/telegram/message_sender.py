@@ -1,5 +1,8 @@
 import asyncio
-from typing import Optional, Dict, Any
+import logging
+import random
+import time
+from typing import Optional, Dict, Any, List
 from telegram import Update, Bot
 from telegram.error import TelegramError, RetryAfter, TimedOut, Forbidden
 from infrastructure.monitoring.logging import StructuredLogger
@@ -7,6 +10,31 @@ from infrastructure.monitoring.metrics import metrics_collector
 from .telegram_rate_limiter import TelegramRateLimiter
 from domain.exception.telegram import TelegramExceptions
 
+# Статус "печатает" живет в Telegram 5 секунд: чаще этого интервала его не обновляем
+_TYPING_INTERVAL = 4.0
+_TYPING_MAX_CHATS = 10_000
+
+# Окно объединения сообщений в send_message_batched и предел длины объединенного текста
+_COALESCE_INTERVAL = 0.05
+_COALESCE_MAX_CHARS = 4000
+
+# Ошибки отправки: (класс, тип ошибки, метрика, метод логгера); порядок важен - от частных к общим
+_SEND_ERRORS = (
+    (TimedOut, TelegramExceptions.TimedOut, "timeout", "warning"),
+    (Forbidden, TelegramExceptions.Forbidden, "forbidden", "warning"),
+)
+
+
+def _classify_send_error(error: Exception) -> tuple[TelegramExceptions, str, str]:
+    """Тип ошибки, метка метрики и метод логгера для неудачной отправки"""
+    for error_class, error_type, metric, log_method in _SEND_ERRORS:
+        if isinstance(error, error_class):
+            return error_type, metric, log_method
+    if isinstance(error, TelegramError):
+        return TelegramExceptions.TelegramError, f"error_{error.__class__.__name__}", "error"
+    return TelegramExceptions.Other, "unexpected_error", "error"
+
+
 class TelegramMessageSender:
     """
     Обертка для безопасной отправки сообщений через Telegram API
@@ -18,29 +46,40 @@ class TelegramMessageSender:
         self.logger = StructuredLogger("telegram_sender")
         self._max_retries = 3
         self._base_delay = 1.0
+        # Задержки экспоненциального backoff по номеру попытки: 1, 2, 4...
+        self._backoff = tuple(self._base_delay * (1 << i) for i in range(self._max_retries))
 
-    async def send_typing_status(self, bot: Bot, chat_id: int):
-        try:
-            # Получаем разрешение от rate limiter
-            await bot.send_chat_action(chat_id=chat_id, action="typing")
-        except Exception as e:
-            # Неожиданные ошибки
-            self.logger.error(f"Unexpected error sending status to chat {chat_id}: {e}")
-            metrics_collector.record_telegram_send("unexpected_error")
+        # Накопленные для объединения сообщения и отложенные задачи их отправки по чатам
+        self._pending: Dict[int, List[str]] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        # Последняя запланированная отправка объединенного текста по чатам - следующая ждет ее, сохраняя порядок
+        self._sending: Dict[int, asyncio.Task] = {}
 
-            return False
+        # Когда в чат последний раз отправлялся статус "печатает"
+        self._typing_sent: Dict[int, float] = {}
+
+    async def send_typing_status(self, bot: Bot, chat_id: int) -> bool:
+        """Статус "печатает"; повторно в тот же чат не чаще раза в _TYPING_INTERVAL (Telegram держит его 5 секунд)"""
+        now = time.monotonic()
+        if now - self._typing_sent.get(chat_id, float('-inf')) < _TYPING_INTERVAL:
+            return True
 
-    async def send_invoice(self, bot: Bot, chat_id: int):
         try:
-            # Получаем разрешение от rate limiter
             await bot.send_chat_action(chat_id=chat_id, action="typing")
         except Exception as e:
             # Неожиданные ошибки
-            self.logger.error(f"Unexpected error sending status to chat {chat_id}: {e}")
+            self.logger.error("Unexpected error sending status to chat %s: %s", chat_id, e)
             metrics_collector.record_telegram_send("unexpected_error")
-
             return False
 
+        if len(self._typing_sent) >= _TYPING_MAX_CHATS:
+            self._typing_sent = {
+                cid: sent_at for cid, sent_at in self._typing_sent.items()
+                if now - sent_at < _TYPING_INTERVAL
+            }
+        self._typing_sent[chat_id] = now
+        return True
+
     async def send_message(
         self,
         bot: Bot,
@@ -56,16 +95,18 @@ class TelegramMessageSender:
         Returns:
             bool: Успешно ли отправлено сообщение
         """
+        record = metrics_collector.record_telegram_send
+        last_attempt = self._max_retries - 1
+
         for attempt in range(self._max_retries):
             try:
                 # Получаем разрешение от rate limiter
-                async with self.rate_limiter.acquire_for_chat(chat_id, "send_message") as allowed:
-                    if not allowed:
-                        if attempt == self._max_retries - 1:
-                            self.logger.error(f"Failed to send message to {chat_id}: rate limit exceeded")
-                            metrics_collector.record_telegram_send("rate_limit_exceeded")
-                            return False, None
-                        continue
+                if not await self.rate_limiter.try_acquire(chat_id, "send_message"):
+                    if attempt == last_attempt:
+                        self.logger.error("Failed to send message to %s: rate limit exceeded", chat_id)
+                        record("rate_limit_exceeded")
+                        return False, None
+                    continue
 
                 # Отправляем сообщение
                 await bot.send_message(
@@ -76,73 +117,94 @@ class TelegramMessageSender:
                     **kwargs
                 )
 
-                metrics_collector.record_telegram_send("success")
-                self.logger.debug(f"Message sent to chat {chat_id}", extra={
-                    'chat_id': chat_id,
-                    'text_length': len(text),
-                    'attempt': attempt + 1
-                })
+                record("success")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Message sent to chat %s", chat_id, extra={
+                        'chat_id': chat_id,
+                        'text_length': len(text),
+                        'attempt': attempt + 1
+                    })
                 return True, None
 
             except RetryAfter as e:
                 # Telegram просит подождать
                 wait_time = e.retry_after
-                self.logger.warning(f"Telegram RetryAfter: waiting {wait_time}s for chat {chat_id}")
-                metrics_collector.record_telegram_send("retry_after")
+                self.logger.warning("Telegram RetryAfter: waiting %ss for chat %s", wait_time, chat_id)
+                record("retry_after")
 
-                if attempt < self._max_retries - 1:
-                    await asyncio.sleep(wait_time)
-                else:
-                    self.logger.error(f"Failed to send message after {self._max_retries} retries")
+                if attempt == last_attempt:
+                    self.logger.error("Failed to send message after %s retries", self._max_retries)
                     return False, TelegramExceptions.RetryAfter
 
-            except TimedOut as e:
-                # Таймаут - пробуем снова
-                self.logger.warning(f"Telegram timeout for chat {chat_id}, attempt {attempt + 1}")
-                metrics_collector.record_telegram_send("timeout")
-
-                if attempt < self._max_retries - 1:
-                    delay = self._base_delay * (2 ** attempt)  # Exponential backoff
-                    await asyncio.sleep(delay)
-                else:
-                    self.logger.error(f"Failed to send message due to timeout after {self._max_retries} attempts")
-                    return False, TelegramExceptions.TimedOut
-
-            except Forbidden as e:
-                self.logger.warning(f"User was blocked bot for chat {chat_id}, attempt {attempt + 1}")
-                metrics_collector.record_telegram_send("forbidden")
-
-                if attempt < self._max_retries - 1:
-                    delay = self._base_delay * (2 ** attempt)  # Exponential backoff
-                    await asyncio.sleep(delay)
-                else:
-                    self.logger.error(f"Failed to send message due to timeout after {self._max_retries} attempts")
-                    return False, TelegramExceptions.Forbidden
-
-            except TelegramError as e:
-                # Другие ошибки Telegram
-                self.logger.error(f"Telegram error for chat {chat_id}: {e}")
-                metrics_collector.record_telegram_send(f"error_{e.__class__.__name__}")
-
-                if attempt < self._max_retries - 1:
-                    delay = self._base_delay * (2 ** attempt)
-                    await asyncio.sleep(delay)
-                else:
-                    return False, TelegramExceptions.TelegramError
+                # Сдвигаем очередь чата: ждать будет следующий try_acquire,
+                # и вместе с этой отправкой подождут все остальные в этот чат
+                self.rate_limiter.defer_chat(chat_id, wait_time)
 
             except Exception as e:
-                # Неожиданные ошибки
-                self.logger.error(f"Unexpected error sending to chat {chat_id}: {e}")
-                metrics_collector.record_telegram_send("unexpected_error")
+                error_type, metric, log_method = _classify_send_error(e)
+                getattr(self.logger, log_method)(
+                    "Failed to send to chat %s (%s), attempt %s: %s", chat_id, metric, attempt + 1, e
+                )
+                record(metric)
+
+                # После последней попытки не спим - сразу возвращаем ошибку
+                if attempt == last_attempt:
+                    self.logger.error("Failed to send message to %s after %s attempts", chat_id, self._max_retries)
+                    return False, error_type
 
-                if attempt < self._max_retries - 1:
-                    delay = self._base_delay * (2 ** attempt)
-                    await asyncio.sleep(delay)
-                else:
-                    return False, TelegramExceptions.Other
+                # Разброс задержки, чтобы упавшие одновременно отправки не повторялись синхронно
+                delay = self._backoff[attempt]
+                await asyncio.sleep(random.uniform(delay * 0.5, delay))
 
         return False, None
 
+    async def send_message_batched(self, bot: Bot, chat_id: int, text: str):
+        """
+        Отправка с объединением: сообщения в один чат за _COALESCE_INTERVAL
+        уходят одним send_message через перевод строки (не больше _COALESCE_MAX_CHARS символов)
+        """
+        parts = self._pending.get(chat_id)
+        overflow = None
+        if parts is not None and sum(map(len, parts)) + len(parts) + len(text) > _COALESCE_MAX_CHARS:
+            # Не влезает - накопленное уходит сразу. Буфер и задачу отцепляем без await:
+            # иначе параллельный вызов успеет завести новый буфер, и он будет перезаписан
+            self._flush_tasks.pop(chat_id).cancel()
+            del self._pending[chat_id]
+            overflow = self._schedule_send(bot, chat_id, parts)
+            parts = None
+
+        if parts is None:
+            parts = self._pending[chat_id] = []
+            self._flush_tasks[chat_id] = asyncio.create_task(self._flush_later(bot, chat_id))
+
+        parts.append(text)
+
+        if overflow is not None:
+            await asyncio.shield(overflow)
+
+    async def _flush_later(self, bot: Bot, chat_id: int):
+        await asyncio.sleep(_COALESCE_INTERVAL)
+        # Буфер и задача снимаются вместе, без await между ними; чужую задачу не трогаем
+        if self._flush_tasks.get(chat_id) is not asyncio.current_task():
+            return
+        del self._flush_tasks[chat_id]
+        parts = self._pending.pop(chat_id, None)
+        if parts:
+            self._schedule_send(bot, chat_id, parts)
+
+    def _schedule_send(self, bot: Bot, chat_id: int, parts: List[str]) -> asyncio.Task:
+        """Отправить объединенные части после всех ранее запланированных отправок в этот чат"""
+        task = asyncio.create_task(self._send_after(self._sending.get(chat_id), bot, chat_id, "\n".join(parts)))
+        self._sending[chat_id] = task
+        task.add_done_callback(lambda t: self._sending.pop(chat_id) if self._sending.get(chat_id) is t else None)
+        return task
+
+    async def _send_after(self, previous: Optional[asyncio.Task], bot: Bot, chat_id: int, text: str):
+        if previous is not None:
+            # wait не пробрасывает ни исключение, ни отмену в предыдущую отправку
+            await asyncio.wait((previous,))
+        await self.send_message(bot, chat_id, text)
+
     async def reply_to_message(
         self,
         bot: Bot,
@@ -152,16 +214,22 @@ class TelegramMessageSender:
         **kwargs
     ) -> bool:
         """Безопасный ответ на сообщение"""
-        if not update.message:
+        message = update.message
+        if not message:
             self.logger.warning("No message to reply to")
             return False
 
+        # Пустой текст Telegram все равно отклонит - не тратим слот rate limiter'а
+        if not text:
+            self.logger.warning("Empty reply text for chat %s", message.chat_id)
+            return False
+
         result, error = await self.send_message(
             bot=bot,
-            chat_id=update.message.chat_id,
+            chat_id=message.chat_id,
             text=text,
             parse_mode=parse_mode,
-            reply_to_message_id=update.message.message_id,
+            reply_to_message_id=message.message_id,
             **kwargs
         )
         return result
@@ -1,12 +1,50 @@
+import time
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
 from domain.entity.user import User
+from infrastructure.monitoring.logging import StructuredLogger
+
+# Кэш сущностей пользователей, созданных из данных Telegram
+_USER_CACHE_TTL = 300.0
+_USER_CACHE_MAX_SIZE = 10_000
 
 
 class TelegramMiddleware:
-    @staticmethod
-    def create_user_from_telegram(telegram_user) -> User:
-        return User(
+    def __init__(self, logger: StructuredLogger = None):
+        self.logger = logger or StructuredLogger("telegram_middleware")
+        self._user_cache = {}  # {user_id: (expires_at, (username, first_name, last_name), User)}
+
+    async def bind_logger(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Привязывает к чату логгер с контекстом пользователя (один раз на пользователя)"""
+        user = update.effective_user
+        if user is None or context.chat_data is None:
+            return
+
+        log = context.chat_data.get('log')
+        if log is None or log.context.get('user_id') != user.id:
+            context.chat_data['log'] = self.logger.bind(user_id=user.id, username=user.username)
+
+    def create_user_from_telegram(self, telegram_user) -> User:
+        """Сущность пользователя из данных Telegram; переиспользуется, пока имя пользователя не менялось"""
+        now = time.monotonic()
+        names = (telegram_user.username, telegram_user.first_name, telegram_user.last_name)
+
+        cached = self._user_cache.get(telegram_user.id)
+        if cached and cached[0] > now and cached[1] == names:
+            user = cached[2]
+            user.update_last_seen()
+            return user
+
+        user = User(
             user_id=telegram_user.id,
             username=telegram_user.username,
             first_name=telegram_user.first_name,
             last_name=telegram_user.last_name
-        )
\ No newline at end of file
+        )
+
+        if len(self._user_cache) >= _USER_CACHE_MAX_SIZE:
+            self._user_cache = {uid: entry for uid, entry in self._user_cache.items() if entry[0] > now}
+        self._user_cache[telegram_user.id] = (now + _USER_CACHE_TTL, names, user)
+        return user
@@ -1,16 +1,30 @@
 import asyncio
 import time
-from typing import Dict, Optional
+from collections import deque
+from typing import Deque, Dict, Optional
 from dataclasses import dataclass
-from contextlib import asynccontextmanager
 from infrastructure.monitoring.logging import StructuredLogger
+from infrastructure.monitoring.metrics import metrics_collector
 
+# Дольше этого ждать освобождения бурст-лимита не будем - отказываем в отправке
+_MAX_BURST_WAIT = 1.0
 
-@dataclass
+# Ожидание короче этого (погрешность вычислений) не стоит лишнего прохода event loop
+_MIN_SLEEP = 0.001
+
+# Окно бурст-лимита, секунды
+_BURST_WINDOW = 10.0
+
+# При таком числе отслеживаемых чатов неактивные вычищаются при добавлении нового
+_MAX_TRACKED_CHATS = 10_000
+
+
+@dataclass(frozen=True, slots=True)
 class TelegramRateLimitConfig:
     """Конфигурация лимитов Telegram API"""
-    messages_per_second: int = 30  # Общий лимит Telegram
+    messages_per_second: int = 28  # Общий лимит Telegram (30) с небольшим запасом
     burst_limit: int = 5  # Максимум сообщений в короткий период
+    per_chat_interval: float = 1.0  # Минимальный интервал между сообщениями в один чат
 
 
 class TelegramRateLimiter:
@@ -23,120 +37,126 @@ class TelegramRateLimiter:
         self.config = config or TelegramRateLimitConfig()
         self.logger = StructuredLogger("telegram_rate_limiter")
 
-        # Глобальные счетчики
-        self._global_tokens = self.config.messages_per_second
-        self._last_global_refill = time.time()
-        self._global_lock = asyncio.Lock()
+        # Монотонные часы: не скачут при коррекции системного времени
+        self._now = time.monotonic
+
+        # Глобальный token bucket
+        self._global_tokens = float(self.config.messages_per_second)
+        self._last_global_refill = self._now()
 
         # Бурст-защита
-        self._burst_messages: Dict[int, list] = {}  # Временные метки сообщений по чатам
-        self._burst_lock = asyncio.Lock()
+        self._burst_messages: Dict[int, Deque[float]] = {}  # Временные метки сообщений по чатам
 
-    async def _refill_global_tokens(self):
-        """Пополнение глобальных токенов"""
-        now = time.time()
-        elapsed = now - self._last_global_refill
+        # Ближайшее время, когда в чат можно отправить следующее сообщение
+        self._chat_next_send: Dict[int, float] = {}
 
-        if elapsed >= 1.0:
-            self._global_tokens = self.config.messages_per_second
-            self._last_global_refill = now
-        else:
-            # Добавляем пропорционально прошедшему времени
-            new_tokens = elapsed * self.config.messages_per_second
-            self._global_tokens = min(
-                self.config.messages_per_second,
-                self._global_tokens + new_tokens
-            )
+    def _refill_global_tokens(self, now: float):
+        """Пополнение глобальных токенов пропорционально прошедшему времени"""
+        rate = self.config.messages_per_second
+        elapsed = now - self._last_global_refill
+        if elapsed > 0:
+            self._global_tokens = min(rate, self._global_tokens + elapsed * rate)
             self._last_global_refill = now
 
-    async def _check_burst_limit(self, chat_id: int) -> bool:
-        """Проверка бурст-лимита для предотвращения спама"""
-        async with self._burst_lock:
-            now = time.time()
-
-            if chat_id not in self._burst_messages:
-                self._burst_messages[chat_id] = []
-
-            # Удаляем старые записи (старше 10 секунд)
-            self._burst_messages[chat_id] = [
-                ts for ts in self._burst_messages[chat_id]
-                if now - ts < 10.0
-            ]
+    def _reserve(self, chat_id: int, now: float) -> Optional[float]:
+        """
+        Резервирует слот отправки в чат и глобальный токен.
+        Возвращает время ожидания до отправки или None, если бурст-лимит чата исчерпан надолго.
 
-            # Проверяем лимит
-            if len(self._burst_messages[chat_id]) >= self.config.burst_limit:
-                return False
+        Метод синхронный (без await), поэтому в одном event loop выполняется атомарно и блокировка не нужна.
+        """
+        config = self.config
+
+        # 1. Интервал между сообщениями в один чат
+        send_at = max(now, self._chat_next_send.get(chat_id, 0.0))
+
+        # 2. Бурст-лимит: не больше burst_limit сообщений за 10 секунд
+        timestamps = self._burst_messages.get(chat_id)
+        if timestamps is None:
+            if len(self._burst_messages) >= _MAX_TRACKED_CHATS:
+                self._evict_idle_chats(now)
+            timestamps = self._burst_messages[chat_id] = deque(maxlen=config.burst_limit)
+
+        # Удаляем старые записи (старше окна) - они всегда в начале очереди
+        while timestamps and send_at - timestamps[0] >= _BURST_WINDOW:
+            timestamps.popleft()
+
+        if len(timestamps) >= config.burst_limit:
+            burst_at = timestamps[0] + _BURST_WINDOW
+            if burst_at - send_at > _MAX_BURST_WAIT:
+                return None
+            send_at = burst_at
+
+        # 3. Глобальный лимит: токен берется сразу, при нехватке баланс уходит в минус,
+        # и следующие отправители ждут дольше - без повторной проверки после сна
+        self._refill_global_tokens(now)
+        self._global_tokens -= 1
+        if self._global_tokens < 0:
+            send_at = max(send_at, now - self._global_tokens / config.messages_per_second)
+
+        timestamps.append(send_at)
+        self._chat_next_send[chat_id] = send_at + config.per_chat_interval
+        return send_at - now
+
+    def _evict_idle_chats(self, now: float):
+        """Забыть чаты, у которых и бурст-окно, и интервал до следующей отправки уже истекли"""
+        cutoff = now - _BURST_WINDOW
+        self._burst_messages = {
+            chat_id: timestamps for chat_id, timestamps in self._burst_messages.items()
+            if timestamps and timestamps[-1] > cutoff
+        }
+        self._chat_next_send = {
+            chat_id: send_at for chat_id, send_at in self._chat_next_send.items()
+            if send_at > now
+        }
+        self.logger.debug("Evicted idle chats, %s tracked", len(self._burst_messages))
 
-            # Добавляем текущее сообщение
-            self._burst_messages[chat_id].append(now)
-            return True
+    def defer_chat(self, chat_id: int, delay: float):
+        """Отложить все следующие отправки в чат на delay секунд (после RetryAfter от Telegram)"""
+        send_at = self._now() + delay
+        if send_at > self._chat_next_send.get(chat_id, 0.0):
+            self._chat_next_send[chat_id] = send_at
 
-    @asynccontextmanager
-    async def acquire_for_chat(self, chat_id: int, operation: str = "send_message"):
+    async def try_acquire(self, chat_id: int, operation: str = "send_message") -> bool:
         """
-        Асинхронный контекстный менеджер для получения разрешения на отправку
+        Дождаться разрешения на отправку в чат
 
         Args:
             chat_id: ID чата
             operation: Тип операции (для логирования)
 
-        Yields:
-            bool: True если можно отправлять, False если нужно ждать
+        Returns:
+            bool: True если можно отправлять, False если отправку нужно отменить
         """
-        wait_time = 0
-
         try:
-            # 1. Проверяем бурст-лимит
-            if not await self._check_burst_limit(chat_id):
-                wait_time = 1.0
+            wait_time = self._reserve(chat_id, self._now())
+
+            if wait_time is None:
+                self.logger.warning("Burst limit exceeded for chat %s", chat_id)
+                metrics_collector.record_telegram_rate_limit_blocked("burst")
+                return False
+
+            # Спим один раз: слот уже зарезервирован
+            waited = 0.0
+            if wait_time > _MIN_SLEEP:
+                started = self._now()
                 await asyncio.sleep(wait_time)
-                # После ожидания снова проверяем
-                if not await self._check_burst_limit(chat_id):
-                    self.logger.warning(f"Burst limit exceeded for chat {chat_id}")
-                    yield False
-                    return
-
-            # 2. Проверяем глобальный лимит
-            async with self._global_lock:
-                await self._refill_global_tokens()
-
-                if self._global_tokens < 1:
-                    # Ждем до пополнения токенов
-                    wait_until = self._last_global_refill + 1.0
-                    wait_time = max(0, wait_until - time.time())
-                    if wait_time > 0:
-                        await asyncio.sleep(wait_time)
-                        await self._refill_global_tokens()
-
-                if self._global_tokens >= 1:
-                    self._global_tokens -= 1
-                    global_acquired = True
-                else:
-                    global_acquired = False
-
-            if not global_acquired:
-                self.logger.warning("Global Telegram rate limit exceeded")
-                yield False
-                return
-
-            # Все проверки пройдены
-            if wait_time > 0:
-                self.logger.info(f"Telegram rate limit wait: {wait_time:.2f}s for {operation} to chat {chat_id}")
-
-            yield True
+                waited = self._now() - started
+                self.logger.info("Telegram rate limit wait: %.2fs for %s to chat %s", wait_time, operation, chat_id)
+
+            metrics_collector.record_telegram_rate_limit_granted(waited)
+            return True
 
         except Exception as e:
-            self.logger.error(f"Telegram rate limiter error: {e}")
-            yield False
+            self.logger.error("Telegram rate limiter error: %s", e)
+            metrics_collector.record_telegram_rate_limit_blocked("error")
+            return False
 
     async def get_status(self, chat_id: int) -> Dict:
         """Получить статус лимитов для отладки"""
-        async with self._global_lock:
-            global_tokens = self._global_tokens
-            time_to_global_refill = max(0, 1.0 - (time.time() - self._last_global_refill))
-
-        async with self._burst_lock:
-            burst_count = len(self._burst_messages.get(chat_id, []))
+        global_tokens = self._global_tokens
+        time_to_global_refill = max(0, 1.0 - (self._now() - self._last_global_refill))
+        burst_count = len(self._burst_messages.get(chat_id, ()))
 
         return {
             "global_tokens": global_tokens,
@@ -144,20 +164,3 @@ class TelegramRateLimiter:
             "burst_messages": burst_count,
             "burst_limit": self.config.burst_limit
         }
-
-    async def cleanup_old_chats(self, older_than_hours: int = 24):
-        """Очистка старых записей о чатах"""
-        async with self._burst_lock:
-            now = time.time()
-            cutoff = now - (older_than_hours * 3600)
-
-            chats_to_remove = [
-                chat_id for chat_id, timestamps in self._burst_messages.items()
-                if not timestamps or max(timestamps) < cutoff
-            ]
-
-            for chat_id in chats_to_remove:
-                del self._burst_messages[chat_id]
-
-        if chats_to_remove:
-            self.logger.info(f"Cleaned up {len(chats_to_remove)} old chat records")
\ No newline at end of file
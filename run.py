@@ -3,64 +3,73 @@ from pathlib import Path
 from dotenv import load_dotenv
 from presentation.telegram.bot import FriendBot
 
-# Добавим отладочную информацию
-print("=== DEBUG ===")
-print("Current working directory:", os.getcwd())
-print("Files in current directory:", os.listdir('.'))
-
-# Проверим, есть ли .env в текущей директории
-env_path = Path('.env')
-print(".env exists:", env_path.exists())
-
-# Если .env не в текущей директории, попробуем найти его в родительской или указать абсолютный путь
-if not env_path.exists():
-    # Попробуем подняться на уровень выше (на всякий случай)
-    env_path = Path('..') / '.env'
-    print("Trying parent directory:", env_path.exists())
-
-if env_path.exists():
-    load_dotenv(env_path)
-    print(f"Loaded .env from: {env_path}")
-else:
-    load_dotenv()  # попытка загрузки из текущего рабочего каталога или родительских
-    print("Loaded .env from default location (if any)")
-
-# Проверим, загрузилась ли переменная TELEGRAM_BOT_TOKEN
-token = os.getenv("TELEGRAM_BOT_TOKEN")
-print("TELEGRAM_BOT_TOKEN:", "SET" if token else "NOT SET")
-
-ai_provider = os.getenv("AI_PROVIDER")
-print("AI_PROVIDER:", f"SET {ai_provider}" if token else "NOT SET")
+def _debug(*args):
+    """Отладочный вывод при запуске - только с DEBUG_ENV"""
+    if os.getenv("DEBUG_ENV"):
+        print(*args)
+
+
+def _load_env():
+    """Загрузка .env из текущей или родительской директории"""
+    _debug("=== DEBUG ===")
+    _debug("Current working directory:", os.getcwd())
+    if os.getenv("DEBUG_ENV"):
+        _debug("Files in current directory:", os.listdir('.'))
+
+    # Проверим, есть ли .env в текущей директории
+    env_path = Path('.env')
+    _debug(".env exists:", env_path.exists())
+
+    # Если .env не в текущей директории, попробуем найти его в родительской или указать абсолютный путь
+    if not env_path.exists():
+        # Попробуем подняться на уровень выше (на всякий случай)
+        env_path = Path('..') / '.env'
+        _debug("Trying parent directory:", env_path.exists())
+
+    if env_path.exists():
+        load_dotenv(env_path)
+        _debug(f"Loaded .env from: {env_path}")
+    else:
+        load_dotenv()  # попытка загрузки из текущего рабочего каталога или родительских
+        _debug("Loaded .env from default location (if any)")
+
+    # Проверим, загрузились ли основные переменные
+    _debug("TELEGRAM_BOT_TOKEN:", "SET" if os.getenv("TELEGRAM_BOT_TOKEN") else "NOT SET")
+    ai_provider = os.getenv("AI_PROVIDER")
+    _debug("AI_PROVIDER:", f"SET {ai_provider}" if ai_provider else "NOT SET")
+
+
+# Ключи API, обязательные для провайдера; для huggingface и ollama ключи не обязательны
+_PROVIDER_KEYS = {
+    "openai": "OPENAI_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+}
 
 
 def check_required_vars():
     """Проверка обязательных переменных в зависимости от провайдера"""
-    ai_provider = os.getenv("AI_PROVIDER").lower()
+    env = os.environ
+    ai_provider = env.get("AI_PROVIDER", "").lower()
     missing_vars = []
 
-    if len(ai_provider) == 0:
+    if not ai_provider:
         missing_vars.append("AI_PROVIDER")
 
     # Обязательные для всех
-    if not os.getenv("TELEGRAM_BOT_TOKEN"):
+    if not env.get("TELEGRAM_BOT_TOKEN"):
         missing_vars.append("TELEGRAM_BOT_TOKEN")
 
     # Проверки по провайдерам
-    if ai_provider == "openai":
-        if not os.getenv("OPENAI_API_KEY"):
-            missing_vars.append("OPENAI_API_KEY")
-    elif ai_provider == "gemini":
-        if not os.getenv("GEMINI_API_KEY"):
-            missing_vars.append("GEMINI_API_KEY")
-    elif ai_provider == "deepseek":
-        if not os.getenv("DEEPSEEK_API_KEY"):
-            missing_vars.append("DEEPSEEK_API_KEY")
-    # Для huggingface и ollama ключи не обязательны
+    provider_key = _PROVIDER_KEYS.get(ai_provider)
+    if provider_key and not env.get(provider_key):
+        missing_vars.append(provider_key)
 
     return missing_vars
 
 
 if __name__ == "__main__":
+    _load_env()
     missing_vars = check_required_vars()
 
     if missing_vars:
@@ -68,11 +77,11 @@ if __name__ == "__main__":
         print("Please check your .env file")
         exit(1)
 
-    # Логируем загруженную конфигурацию
-    print("🔧 Loaded configuration:")
-    print(f"   Metrics port: {os.getenv('METRICS_PORT', '8000')}")
-    print(f"   Tracing: {os.getenv('ENABLE_TRACING', 'true')}")
-    print(f"   Log level: {os.getenv('LOG_LEVEL', 'INFO')}")
+    # Загруженная конфигурация (структурированно ее логирует FriendBot._log_configuration)
+    _debug("🔧 Loaded configuration:")
+    _debug(f"   Metrics port: {os.getenv('METRICS_PORT', '8000')}")
+    _debug(f"   Tracing: {os.getenv('ENABLE_TRACING', 'true')}")
+    _debug(f"   Log level: {os.getenv('LOG_LEVEL', 'INFO')}")
 
     bot = FriendBot()
     bot.run()
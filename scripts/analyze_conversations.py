@@ -6,13 +6,17 @@
 
 import os
 import sys
+import re
 import json
 import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
-import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, Future
+from itertools import groupby
+from operator import itemgetter
 
 # Добавляем путь к проекту для импорта модулей
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -28,6 +32,39 @@ except ImportError as e:
     sys.exit(1)
 
 
+# Ключевые слова для простейшего анализа тем разговоров
+_TOPIC_WORDS = (
+    "привет", "как дела", "как жизнь", "чем занимаешься",
+    "расскажи", "совет", "помоги", "мне грустно", "мне весело",
+    "люблю", "нравится", "хочу", "мечта", "планы"
+)
+_TOPIC_RE = re.compile("|".join(map(re.escape, _TOPIC_WORDS)))
+
+# Ответы бота попадают в промпт только первыми 300 символами - обрезаем их на стороне БД;
+# сообщения пользователя нужны целиком для подсчета тем
+_CONTENT_COLUMN = "CASE WHEN role = 'user' THEN content ELSE LEFT(content, 300) END"
+
+# Потоки для фоновой записи файлов анализа
+_IO_WORKERS = 4
+# Все, кроме букв, цифр, '_', '-' и пробела, - удаляется из имени персонажа в пути
+_UNSAFE_NAME_CHARS_RE = re.compile(r'[^\w\- ]+')
+
+
+def _safe_dir_name(name: str) -> str:
+    """Имя персонажа, очищенное для использования в пути"""
+    return _UNSAFE_NAME_CHARS_RE.sub('', name).rstrip().replace(' ', '_')
+
+
+def _has_both_sides(conversation: Dict[str, Any]) -> bool:
+    """Есть ли в диалоге сообщения и пользователя, и бота (по статистике get_top_conversations)"""
+    return bool(conversation['user_message_count'] and conversation['bot_message_count'])
+
+
+def _write_text(path: Path, text: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
 @dataclass
 class ConversationAnalysis:
     """Анализ диалога пользователя с персонажем"""
@@ -45,58 +82,84 @@ class ConversationAnalysis:
 class ConversationAnalyzer:
     """Анализатор диалогов для улучшения промптов персонажей"""
 
-    def __init__(self, database: Database):
+    def __init__(self, database: Database, split_files: bool = False):
         self.db = database
+        # True - промпт каждого диалога в отдельном файле, иначе один JSONL-файл на персонажа
+        self.split_files = split_files
         self.character_repo = CharacterRepository(database)
         self.output_dir = Path("character_analyses")
         self.output_dir.mkdir(exist_ok=True)
+        # Данные пользователей по user_id: одни и те же пользователи общаются с разными персонажами
+        self._user_cache: Dict[int, Optional[Dict[str, Any]]] = {}
+        # Файлы анализа пишутся в фоне, чтобы запись не задерживала обработку
+        self._io_pool = ThreadPoolExecutor(max_workers=_IO_WORKERS)
+        self._pending_writes: List[Future] = []
+        # Директории персонажей по имени: (директория, raw_conversations)
+        self._char_dir_cache: Dict[str, Tuple[Path, Path]] = {}
 
     def get_all_characters(self) -> List[Character]:
         """Получить всех персонажей"""
         return self.character_repo.get_all_characters(active_only=False)
 
-    def get_character_conversations(self, character_id: int,
-                                    days_back: int = 30,
-                                    min_messages: int = 5) -> List[Dict[str, Any]]:
+    def get_top_conversations(self, days_back: int = 30,
+                              min_messages: int = 5,
+                              per_character: int = 10) -> Dict[int, List[Dict[str, Any]]]:
         """
-        Получить все диалоги для персонажа
+        Получить диалоги для анализа сразу по всем персонажам одним запросом
 
         Args:
-            character_id: ID персонажа
             days_back: сколько дней назад анализировать
             min_messages: минимальное количество сообщений для анализа
+            per_character: сколько самых длинных диалогов брать для каждого персонажа
+
+        Returns:
+            {character_id: [диалоги по убыванию числа сообщений]}; в каждой строке
+            character_conversations - общее число подходящих диалогов персонажа
         """
         cutoff_date = datetime.utcnow() - timedelta(days=days_back)
 
         query = """
-                SELECT cc.user_id, \
-                       u.username, \
-                       u.first_name, \
-                       u.last_name, \
-                       COUNT(*)                                               as total_messages, \
-                       SUM(CASE WHEN cc.role = 'user' THEN 1 ELSE 0 END)      as user_message_count, \
-                       SUM(CASE WHEN cc.role = 'assistant' THEN 1 ELSE 0 END) as bot_message_count, \
-                       MIN(cc.timestamp)                                      as first_message_time, \
-                       MAX(cc.timestamp)                                      as last_message_time
-                FROM conversation_context cc
-                         LEFT JOIN users u ON cc.user_id = u.user_id
-                WHERE cc.character_id = %s
-                  AND cc.deleted_at IS NULL
-                  AND cc.timestamp >= %s
-                GROUP BY cc.user_id, u.username, u.first_name, u.last_name
-                HAVING COUNT(*) >= %s
-                ORDER BY total_messages DESC \
+                WITH per_pair AS (
+                    SELECT cc.character_id,
+                           cc.user_id,
+                           COUNT(*)                                               as total_messages,
+                           SUM(CASE WHEN cc.role = 'user' THEN 1 ELSE 0 END)      as user_message_count,
+                           SUM(CASE WHEN cc.role = 'assistant' THEN 1 ELSE 0 END) as bot_message_count,
+                           MIN(cc.timestamp)                                      as first_message_time,
+                           MAX(cc.timestamp)                                      as last_message_time
+                    FROM conversation_context cc
+                    WHERE cc.deleted_at IS NULL
+                      AND cc.timestamp >= %s
+                    GROUP BY cc.character_id, cc.user_id
+                    HAVING COUNT(*) >= %s
+                ),
+                ranked AS (
+                    SELECT per_pair.*,
+                           ROW_NUMBER() OVER (PARTITION BY character_id ORDER BY total_messages DESC) as rn,
+                           COUNT(*) OVER (PARTITION BY character_id)                                as character_conversations
+                    FROM per_pair
+                )
+                SELECT r.*,
+                       u.username,
+                       u.first_name,
+                       u.last_name
+                FROM ranked r
+                         LEFT JOIN users u ON r.user_id = u.user_id
+                WHERE r.rn <= %s
+                ORDER BY r.character_id, r.rn
                 """
 
-        results = self.db.fetch_all(query, (character_id, cutoff_date, min_messages))
-        return results if results else []
+        # Строки идут по character_id - собираем группы прямо из потока серверного курсора
+        rows = self.db.iter_all(query, (cutoff_date, min_messages, per_character))
+        return {character_id: list(group)
+                for character_id, group in groupby(rows, key=itemgetter('character_id'))}
 
     def get_conversation_messages(self, user_id: int, character_id: int,
                                   limit: int = 100) -> List[Dict[str, Any]]:
         """Получить конкретные сообщения из диалога"""
-        query = """
+        query = f"""
                 SELECT role, \
-                       content, timestamp
+                       {_CONTENT_COLUMN} as content, timestamp
                 FROM conversation_context
                 WHERE user_id = %s
                   AND character_id = %s
@@ -108,10 +171,68 @@ class ConversationAnalyzer:
         results = self.db.fetch_all(query, (user_id, character_id, limit))
         return results if results else []
 
+    def get_messages_for_conversations(self, pairs: List[Tuple[int, int]],
+                                       limit: int = 50) -> Dict[Tuple[int, int], List[Dict[str, Any]]]:
+        """Получить первые limit сообщений сразу для многих диалогов (user_id, character_id) одним запросом"""
+        if not pairs:
+            return {}
+
+        user_ids, character_ids = zip(*pairs)
+        query = f"""
+                SELECT user_id, character_id, role, content, timestamp
+                FROM (SELECT cc.user_id,
+                             cc.character_id,
+                             cc.role,
+                             {_CONTENT_COLUMN} as content,
+                             cc.timestamp,
+                             ROW_NUMBER() OVER (PARTITION BY cc.user_id, cc.character_id
+                                                ORDER BY cc.timestamp ASC) as rn
+                      FROM conversation_context cc
+                               JOIN unnest(%s::bigint[], %s::int[]) AS p(user_id, character_id)
+                                    ON cc.user_id = p.user_id AND cc.character_id = p.character_id
+                      WHERE cc.deleted_at IS NULL) m
+                WHERE rn <= %s
+                ORDER BY user_id, character_id, timestamp ASC
+                """
+
+        rows = self.db.iter_all(query, (list(user_ids), list(character_ids), limit))
+        return {pair: list(group)
+                for pair, group in groupby(rows, key=itemgetter('user_id', 'character_id'))}
+
+    def preload_users(self, user_ids: List[int]):
+        """Загрузить в кэш информацию о еще не загруженных пользователях одним запросом"""
+        missing = [user_id for user_id in set(user_ids) if user_id not in self._user_cache]
+        if not missing:
+            return
+
+        query = """
+                SELECT user_id, username, first_name, last_name, created_at, last_seen
+                FROM users
+                WHERE user_id = ANY(%s)
+                """
+        rows = {row['user_id']: row for row in self.db.fetch_all(query, (missing,)) or []}
+        for user_id in missing:
+            self._user_cache[user_id] = rows.get(user_id)
+
+    def get_user_info(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Информация о пользователе из кэша; с запросом к БД, только если ее еще не загружали"""
+        if user_id not in self._user_cache:
+            user_info_query = """
+                              SELECT user_id, username, first_name, last_name, created_at, last_seen
+                              FROM users
+                              WHERE user_id = %s
+                              """
+            self._user_cache[user_id] = self.db.fetch_one(user_info_query, (user_id,))
+        return self._user_cache[user_id]
+
     def analyze_conversation(self, user_id: int, character_id: int,
-                             character_name: str, limit: int = 50) -> Optional[ConversationAnalysis]:
-        """Проанализировать конкретный диалог"""
-        messages = self.get_conversation_messages(user_id, character_id, limit)
+                             character_name: str, limit: int = 50,
+                             messages: Optional[List[Dict[str, Any]]] = None,
+                             first_message_time: Optional[datetime] = None,
+                             last_message_time: Optional[datetime] = None) -> Optional[ConversationAnalysis]:
+        """Проанализировать конкретный диалог; messages и границы по времени можно передать известными заранее"""
+        if messages is None:
+            messages = self.get_conversation_messages(user_id, character_id, limit)
 
         if not messages:
             return None
@@ -122,15 +243,8 @@ class ConversationAnalyzer:
         if not user_messages or not bot_messages:
             return None
 
-        timestamps = [m['timestamp'] for m in messages]
-
         # Получаем информацию о пользователе
-        user_info_query = """
-                          SELECT username, first_name, last_name, created_at, last_seen
-                          FROM users
-                          WHERE user_id = %s \
-                          """
-        user_info = self.db.fetch_one(user_info_query, (user_id,))
+        user_info = self.get_user_info(user_id)
 
         return ConversationAnalysis(
             user_id=user_id,
@@ -139,45 +253,52 @@ class ConversationAnalyzer:
             total_messages=len(messages),
             user_messages=user_messages,
             bot_messages=bot_messages,
-            first_message_time=min(timestamps),
-            last_message_time=max(timestamps),
+            # Сообщения отсортированы по времени (ORDER BY timestamp ASC)
+            first_message_time=first_message_time or messages[0]['timestamp'],
+            last_message_time=last_message_time or messages[-1]['timestamp'],
             user_info=user_info
         )
 
-    def create_analysis_prompt(self, analysis: ConversationAnalysis,
-                               character: Character) -> str:
-        """Создать промпт для анализа на основе диалога"""
-
-        prompt = f"""# Анализ диалога для улучшения персонажа "{character.name}"
+    def create_character_section(self, character: Character) -> str:
+        """Блок с информацией о персонаже для промптов анализа его диалогов"""
+        return f"""# Анализ диалога для улучшения персонажа "{character.name}"
 
 ## Информация о персонаже:
 - ID: {character.id}
 - Текущий промпт: {character.system_prompt[:200]}...
 - Описание: {character.description[:200]}...
 
-## Информация о пользователе:
+"""
+
+    def create_analysis_prompt(self, analysis: ConversationAnalysis, character: Character,
+                               character_section: Optional[str] = None) -> str:
+        """Создать промпт для анализа на основе диалога; character_section можно передать готовым"""
+
+        user_info = analysis.user_info
+        user_messages = analysis.user_messages
+
+        # Части промпта собираются в список и склеиваются один раз в конце
+        parts = [character_section or self.create_character_section(character), f"""## Информация о пользователе:
 - ID: {analysis.user_id}
-- Имя: {analysis.user_info.get('first_name', 'Не указано') if analysis.user_info else 'Неизвестно'}
-- Username: @{analysis.user_info.get('username', 'нет') if analysis.user_info else 'нет'}
+- Имя: {user_info.get('first_name', 'Не указано') if user_info else 'Неизвестно'}
+- Username: @{user_info.get('username', 'нет') if user_info else 'нет'}
 - Активность: {analysis.first_message_time.strftime('%Y-%m-%d')} - {analysis.last_message_time.strftime('%Y-%m-%d')}
-- Всего сообщений: {analysis.total_messages} (пользователь: {len(analysis.user_messages)}, бот: {len(analysis.bot_messages)})
-
-## Диалог (последние {len(analysis.user_messages)} сообщений пользователя):
-"""
+- Всего сообщений: {analysis.total_messages} (пользователь: {len(user_messages)}, бот: {len(analysis.bot_messages)})
 
-        # Добавляем диалог
-        for i, (user_msg, bot_msg) in enumerate(zip(analysis.user_messages, analysis.bot_messages)):
-            if i >= 10:  # Ограничиваем длину
-                prompt += f"\n... и еще {len(analysis.user_messages) - 10} сообщений"
-                break
+## Диалог (последние {len(user_messages)} сообщений пользователя):
+"""]
 
-            prompt += f"\n### Сообщение {i + 1}:"
-            prompt += f"\n**Пользователь:** {user_msg['content'][:300]}"
-            prompt += f"\n**Ответ бота:** {bot_msg['content'][:300]}"
-            prompt += f"\n---"
+        # Добавляем диалог, ограничивая длину 10 парами сообщений
+        for i, (user_msg, bot_msg) in enumerate(zip(user_messages[:10], analysis.bot_messages[:10]), 1):
+            parts.append(f"\n### Сообщение {i}:"
+                         f"\n**Пользователь:** {user_msg['content'][:300]}"
+                         f"\n**Ответ бота:** {bot_msg['content'][:300]}"
+                         f"\n---")
+        if min(len(user_messages), len(analysis.bot_messages)) > 10:
+            parts.append(f"\n... и еще {len(user_messages) - 10} сообщений")
 
         # Добавляем задачи для анализа
-        prompt += f"""
+        parts.append(f"""
 
 ## Задачи для анализа:
 
@@ -208,9 +329,9 @@ class ConversationAnalyzer:
 
 ## Рекомендации по улучшению промпта:
 (Предложите конкретные изменения в system_prompt персонажа на основе этого диалога)
-"""
+""")
 
-        return prompt
+        return "".join(parts)
 
     def create_summary_prompt(self, character: Character,
                               conversations: List[ConversationAnalysis]) -> str:
@@ -219,9 +340,21 @@ class ConversationAnalyzer:
         if not conversations:
             return f"Нет данных для анализа персонажа '{character.name}'"
 
-        total_users = len(set(c.user_id for c in conversations))
-        total_messages = sum(c.total_messages for c in conversations)
-        avg_messages = total_messages / len(conversations) if conversations else 0
+        # Статистика за один проход по диалогам
+        user_ids = set()
+        total_messages = 0
+        first_time = conversations[0].first_message_time
+        last_time = conversations[0].last_message_time
+        for c in conversations:
+            user_ids.add(c.user_id)
+            total_messages += c.total_messages
+            if c.first_message_time < first_time:
+                first_time = c.first_message_time
+            if c.last_message_time > last_time:
+                last_time = c.last_message_time
+
+        total_users = len(user_ids)
+        avg_messages = total_messages / len(conversations)
 
         # Анализ тем разговоров (простейший)
         common_topics = self._extract_common_topics(conversations)
@@ -234,7 +367,7 @@ class ConversationAnalyzer:
 - Уникальных пользователей: {total_users}
 - Всего сообщений: {total_messages}
 - Средняя длина диалога: {avg_messages:.1f} сообщений
-- Период анализа: {min(c.first_message_time for c in conversations).strftime('%Y-%m-%d')} - {max(c.last_message_time for c in conversations).strftime('%Y-%m-%d')}
+- Период анализа: {first_time.strftime('%Y-%m-%d')} - {last_time.strftime('%Y-%m-%d')}
 
 ## Текущий промпт персонажа:
         
@@ -279,47 +412,37 @@ class ConversationAnalyzer:
 
     def _extract_common_topics(self, conversations: List[ConversationAnalysis]) -> str:
         """Извлечь общие темы из диалогов"""
-        topics = []
-
-        # Простейший анализ ключевых слов
-        common_words = [
-            "привет", "как дела", "как жизнь", "чем занимаешься",
-            "расскажи", "совет", "помоги", "мне грустно", "мне весело",
-            "люблю", "нравится", "хочу", "мечта", "планы"
-        ]
-
-        topic_counts = {word: 0 for word in common_words}
+        # Начальные нули задают порядок слов при равном числе упоминаний
+        topic_counts = Counter(dict.fromkeys(_TOPIC_WORDS, 0))
 
+        # Один проход регулярного выражения по сообщению вместо поиска каждого слова;
+        # как и раньше, слово считается один раз на сообщение
+        findall = _TOPIC_RE.findall
         for conv in conversations:
             for user_msg in conv.user_messages:
-                content_lower = user_msg['content'].lower()
-                for word in common_words:
-                    if word in content_lower:
-                        topic_counts[word] += 1
+                topic_counts.update(set(findall(user_msg['content'].lower())))
 
         # Форматируем результат
-        result = []
-        for word, count in sorted(topic_counts.items(), key=lambda x: x[1], reverse=True):
-            if count > 0:
-                result.append(f"- {word}: {count} упоминаний")
+        result = [f"- {word}: {count} упоминаний"
+                  for word, count in topic_counts.most_common() if count > 0]
 
         return "\n".join(result) if result else "Не удалось определить общие темы"
 
+    def _get_character_dirs(self, character_name: str) -> Tuple[Path, Path]:
+        """Директория персонажа и ее поддиректория исходных данных; создаются один раз за запуск"""
+        dirs = self._char_dir_cache.get(character_name)
+        if dirs is None:
+            char_dir = self.output_dir / _safe_dir_name(character_name)
+            raw_dir = char_dir / "raw_conversations"
+            raw_dir.mkdir(parents=True, exist_ok=True)
+            dirs = self._char_dir_cache[character_name] = (char_dir, raw_dir)
+        return dirs
+
     def save_analysis(self, character_name: str, user_id: int,
                      prompt: str, summary: bool = False):
         """Сохранить анализ в файл"""
 
-        # Очищаем имя персонажа для использования в пути
-        safe_name = "".join(c for c in character_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_name = safe_name.replace(' ', '_')
-
-        # Создаем директорию для персонажа
-        char_dir = self.output_dir / safe_name
-        char_dir.mkdir(exist_ok=True)
-
-        # Создаем поддиректорию для исходных данных
-        raw_dir = char_dir / "raw_conversations"
-        raw_dir.mkdir(exist_ok=True)
+        char_dir, raw_dir = self._get_character_dirs(character_name)
 
         # Определяем имя файла
         if summary:
@@ -329,54 +452,69 @@ class ConversationAnalyzer:
             filename = f"user_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
             filepath = raw_dir / filename
 
-        # Сохраняем файл
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(prompt)
+        # Сохраняем файл в фоне; ошибки записи поднимутся в wait_for_writes
+        self._pending_writes.append(self._io_pool.submit(_write_text, filepath, prompt))
 
         return filepath
 
-    def analyze_all_characters(self, days_back: int = 30,
-                              min_conversations: int = 3,
-                              min_messages: int = 5):
-        """Проанализировать всех персонажей"""
-
-        print("🔍 Начинаю анализ взаимодействий...")
-        characters = self.get_all_characters()
-        print(f"Найдено персонажей: {len(characters)}")
+    def save_raw_prompts(self, character_name: str, records: List[Dict[str, Any]]) -> Path:
+        """Сохранить промпты всех диалогов персонажа одним JSONL-файлом"""
+        _, raw_dir = self._get_character_dirs(character_name)
+        filepath = raw_dir / f"prompts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
 
-        results = {}
+        content = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        self._pending_writes.append(self._io_pool.submit(_write_text, filepath, content))
 
-        for character in characters:
-            print(f"\n📊 Анализирую персонажа: {character.name} (ID: {character.id})")
+        return filepath
 
-            # Получаем диалоги для персонажа
-            conversations_data = self.get_character_conversations(
-                character.id, days_back, min_messages
-            )
+    def wait_for_writes(self):
+        """Дождаться записи всех файлов анализа"""
+        pending, self._pending_writes = self._pending_writes, []
+        for future in pending:
+            future.result()
+
+    def _process_character(self, character: Character,
+                           conversations_data: Optional[List[Dict[str, Any]]],
+                           messages_by_pair: Dict[Tuple[int, int], List[Dict[str, Any]]],
+                           min_messages: int) -> Optional[Dict[str, Any]]:
+        """Проанализировать диалоги одного персонажа; вернуть итог для отчета"""
+        print(f"\n📊 Анализирую персонажа: {character.name} (ID: {character.id})")
+
+        if not conversations_data:
+            print(f"  Нет диалогов для анализа (минимум {min_messages} сообщений)")
+            return None
 
-            if not conversations_data:
-                print(f"  Нет диалогов для анализа (минимум {min_messages} сообщений)")
-                continue
+        total_conversations = conversations_data[0]['character_conversations']
+        print(f"  Найдено диалогов для анализа: {total_conversations}")
 
-            print(f"  Найдено диалогов для анализа: {len(conversations_data)}")
+        # Анализируем каждый диалог
+        detailed_analyses = []
+        raw_prompts = []
+        # Общий для всех диалогов персонажа блок промпта собирается один раз
+        character_section = self.create_character_section(character)
+        for i, conv_data in enumerate(conversations_data):
+            print(f"  Анализ диалога {i+1}/{len(conversations_data)}...")
 
-            # Анализируем каждый диалог
-            detailed_analyses = []
-            for i, conv_data in enumerate(conversations_data[:10]):  # Ограничиваем для производительности
-                print(f"  Анализ диалога {i+1}/{min(10, len(conversations_data))}...")
+            # По статистике группы видно, что анализировать нечего: нет реплик одной из сторон
+            if not _has_both_sides(conv_data):
+                continue
 
-                analysis = self.analyze_conversation(
-                    conv_data['user_id'],
-                    character.id,
-                    character.name,
-                    limit=50
-                )
+            analysis = self.analyze_conversation(
+                conv_data['user_id'],
+                character.id,
+                character.name,
+                limit=50,
+                messages=messages_by_pair.get((conv_data['user_id'], character.id), []),
+                first_message_time=conv_data['first_message_time'],
+                last_message_time=conv_data['last_message_time']
+            )
 
-                if analysis:
-                    detailed_analyses.append(analysis)
+            if analysis:
+                detailed_analyses.append(analysis)
 
-                    # Создаем и сохраняем промпт для отдельного диалога
-                    prompt = self.create_analysis_prompt(analysis, character)
+                # Создаем промпт для отдельного диалога
+                prompt = self.create_analysis_prompt(analysis, character, character_section)
+                if self.split_files:
                     filepath = self.save_analysis(
                         character.name,
                         conv_data['user_id'],
@@ -384,23 +522,60 @@ class ConversationAnalyzer:
                         summary=False
                     )
                     print(f"    → Сохранен: {filepath.name}")
+                else:
+                    raw_prompts.append({'user_id': conv_data['user_id'], 'prompt': prompt})
 
-            # Создаем и сохраняем суммарный анализ
-            if detailed_analyses:
-                summary_prompt = self.create_summary_prompt(character, detailed_analyses)
-                summary_path = self.save_analysis(
-                    character.name,
-                    0,  # 0 для сводного файла
-                    summary_prompt,
-                    summary=True
-                )
-                print(f"  📄 Сводный анализ сохранен: {summary_path.name}")
+        if not detailed_analyses:
+            return None
 
-                results[character.name] = {
-                    'total_conversations': len(conversations_data),
-                    'analyzed_conversations': len(detailed_analyses),
-                    'summary_file': str(summary_path)
-                }
+        if raw_prompts:
+            prompts_path = self.save_raw_prompts(character.name, raw_prompts)
+            print(f"  → Промпты диалогов сохранены: {prompts_path.name}")
+
+        # Создаем и сохраняем суммарный анализ
+        summary_prompt = self.create_summary_prompt(character, detailed_analyses)
+        summary_path = self.save_analysis(
+            character.name,
+            0,  # 0 для сводного файла
+            summary_prompt,
+            summary=True
+        )
+        print(f"  📄 Сводный анализ сохранен: {summary_path.name}")
+
+        return {
+            'total_conversations': total_conversations,
+            'analyzed_conversations': len(detailed_analyses),
+            'summary_file': str(summary_path)
+        }
+
+    def analyze_all_characters(self, days_back: int = 30,
+                              min_conversations: int = 3,
+                              min_messages: int = 5):
+        """Проанализировать всех персонажей"""
+
+        print("🔍 Начинаю анализ взаимодействий...")
+        characters = self.get_all_characters()
+        print(f"Найдено персонажей: {len(characters)}")
+
+        # Диалоги всех персонажей одним запросом, не больше 10 на персонажа (для производительности)
+        conversations_by_character = self.get_top_conversations(days_back, min_messages, per_character=10)
+
+        # Сообщения всех отобранных диалогов и данные их пользователей (в кэш) - еще двумя запросами
+        pairs = [(row['user_id'], row['character_id'])
+                 for rows in conversations_by_character.values() for row in rows
+                 if _has_both_sides(row)]
+        messages_by_pair = self.get_messages_for_conversations(pairs, limit=50)
+        self.preload_users([user_id for user_id, _ in pairs])
+
+        # Данные уже в памяти: по персонажам остается сборка промптов, файлы пишутся в фоне (_io_pool)
+        results = {}
+        for character in characters:
+            result = self._process_character(character, conversations_by_character.get(character.id),
+                                             messages_by_pair, min_messages)
+            if result:
+                results[character.name] = result
+
+        self.wait_for_writes()
 
         # Сохраняем общий отчет
         self.save_report(results)
@@ -409,7 +584,9 @@ class ConversationAnalyzer:
 
     def save_report(self, results: Dict[str, Any]):
         """Сохранить общий отчет"""
-        report_path = self.output_dir / f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        # Одна метка времени для обоих файлов отчета
+        report_stem = f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        report_path = self.output_dir / f"{report_stem}.json"
 
         report = {
             'generated_at': datetime.now().isoformat(),
@@ -425,7 +602,7 @@ class ConversationAnalyzer:
 
         # Также создаем текстовый отчет
         txt_report = self.create_text_report(results)
-        txt_path = self.output_dir / f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        txt_path = self.output_dir / f"{report_stem}.txt"
 
         with open(txt_path, 'w', encoding='utf-8') as f:
             f.write(txt_report)
@@ -434,24 +611,27 @@ class ConversationAnalyzer:
 
     def create_text_report(self, results: Dict[str, Any]) -> str:
         """Создать текстовый отчет"""
-        report = f"""# Отчет анализа взаимодействий с персонажами
+        parts = [f"""# Отчет анализа взаимодействий с персонажами
 
 Дата генерации: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Всего проанализировано персонажей: {len(results)}
 
 {'='*60}
 
-"""
+"""]
 
         for char_name, data in results.items():
-            report += f"## Персонаж: {char_name}\n"
-            report += f"- Всего диалогов: {data['total_conversations']}\n"
-            report += f"- Проанализировано: {data['analyzed_conversations']}\n"
-            report += f"- Сводный файл: {data['summary_file']}\n"
-            report += f"- Папка с диалогами: character_analyses/{''.join(c for c in char_name if c.isalnum() or c in (' ', '-', '_')).rstrip().replace(' ', '_')}/\n"
-            report += "\n"
-
-        report += f"""
+            # Директория уже вычислена при сохранении анализа персонажа
+            dirs = self._char_dir_cache.get(char_name)
+            dir_name = dirs[0].name if dirs else _safe_dir_name(char_name)
+            parts.append(f"## Персонаж: {char_name}\n"
+                         f"- Всего диалогов: {data['total_conversations']}\n"
+                         f"- Проанализировано: {data['analyzed_conversations']}\n"
+                         f"- Сводный файл: {data['summary_file']}\n"
+                         f"- Папка с диалогами: character_analyses/{dir_name}/\n"
+                         f"\n")
+
+        parts.append(f"""
 {'='*60}
 
 ## Структура папок:
@@ -459,19 +639,18 @@ character_analyses/
 ├── Имя_Персонажа_1/
 │   ├── summary_analysis_YYYYMMDD_HHMMSS.txt
 │   └── raw_conversations/
-│       ├── user_123456789_YYYYMMDD_HHMMSS.txt
-│       └── ...
+│       └── prompts_YYYYMMDD_HHMMSS.jsonl   (с --split-files: user_123456789_YYYYMMDD_HHMMSS.txt)
 ├── Имя_Персонажа_2/
 │   └── ...
 └── analysis_report_YYYYMMDD_HHMMSS.json
 
 ## Использование данных:
 1. Сводные файлы (summary_analysis_*.txt) содержат общий анализ по персонажу
-2. Файлы в raw_conversations/ содержат детальные диалоги с пользователями
+2. Файлы в raw_conversations/ содержат детальные диалоги с пользователями (в JSONL - по строке {{"user_id", "prompt"}} на диалог)
 3. Файлы можно передавать LLM для анализа и предложений по улучшению промптов
-"""
+""")
 
-        return report
+        return "".join(parts)
 
 
 def main():
@@ -487,6 +666,8 @@ def main():
                        help='Минимальное количество сообщений в диалоге (по умолчанию: 5)')
     parser.add_argument('--output-dir', type=str, default='character_analyses',
                        help='Директория для сохранения результатов (по умолчанию: character_analyses)')
+    parser.add_argument('--split-files', action='store_true',
+                       help='Сохранять промпт каждого диалога в отдельный .txt вместо одного JSONL на персонажа')
 
     args = parser.parse_args()
 
@@ -500,7 +681,7 @@ def main():
         database = Database()
 
         # Создаем анализатор
-        analyzer = ConversationAnalyzer(database)
+        analyzer = ConversationAnalyzer(database, split_files=args.split_files)
         analyzer.output_dir = Path(args.output_dir)
 
         # Запускаем анализ
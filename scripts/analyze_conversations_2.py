@@ -17,13 +17,19 @@ import sys
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Iterator
 import argparse
 from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 
+# Сколько строк серверный курсор забирает из БД за один раз
+_STREAM_ITERSIZE = 5000
+
+
 # ============================================================================
 # 📄 export_conversations_for_analysis.py
 # ============================================================================
@@ -161,6 +167,32 @@ class ConversationExporter:
 
         return None
 
+    def get_users_info(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Получить информацию сразу о многих пользователях одним запросом"""
+        if not user_ids:
+            return {}
+
+        query = """
+                SELECT user_id, \
+                       username, \
+                       first_name, \
+                       last_name,
+                       created_at, \
+                       last_seen, \
+                       is_admin, \
+                       is_blocked
+                FROM users
+                WHERE user_id = ANY(%s) \
+                """
+
+        try:
+            self.cursor.execute(query, (list(user_ids),))
+            return {row['user_id']: dict(row) for row in self.cursor.fetchall()}
+        except Exception as e:
+            print(f"⚠️ Ошибка получения информации о пользователях: {e}")
+
+        return {}
+
     def get_conversations_for_character(self, character_id: int) -> List[UserDialogue]:
         """Получить все диалоги для конкретного персонажа"""
         query = """
@@ -178,42 +210,46 @@ class ConversationExporter:
                 ORDER BY cc.user_id, cc.timestamp ASC \
                 """
 
-        self.cursor.execute(query, (character_id,))
-        rows = self.cursor.fetchall()
-
-        # Группируем по пользователям
+        # Серверный курсор: строки приходят пачками по _STREAM_ITERSIZE, а не все сразу
         user_dialogues = {}
-
-        for row in rows:
-            user_id = row['user_id']
-
-            if user_id not in user_dialogues:
-                user_dialogues[user_id] = {
-                    'user_id': user_id,
-                    'character_id': character_id,
-                    'character_name': row['character_name'],
-                    'messages': [],
-                    'first_message_date': None,
-                    'last_message_date': None
-                }
-
-            message = ConversationMessage(
-                role=row['role'],
-                content=row['content'],
-                timestamp=row['timestamp'],
-                message_id=row['id']
-            )
-
-            user_dialogues[user_id]['messages'].append(message)
-
-            # Обновляем даты
-            if not user_dialogues[user_id]['first_message_date'] or message.timestamp < user_dialogues[user_id][
-                'first_message_date']:
-                user_dialogues[user_id]['first_message_date'] = message.timestamp
-
-            if not user_dialogues[user_id]['last_message_date'] or message.timestamp > user_dialogues[user_id][
-                'last_message_date']:
-                user_dialogues[user_id]['last_message_date'] = message.timestamp
+        with self.connection.cursor(name=f"conv_{character_id}", cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = _STREAM_ITERSIZE
+            cursor.execute(query, (character_id,))
+
+            # Группируем по пользователям
+            for row in cursor:
+                user_id = row['user_id']
+
+                if user_id not in user_dialogues:
+                    user_dialogues[user_id] = {
+                        'user_id': user_id,
+                        'character_id': character_id,
+                        'character_name': row['character_name'],
+                        'messages': [],
+                        'first_message_date': None,
+                        'last_message_date': None
+                    }
+
+                message = ConversationMessage(
+                    role=row['role'],
+                    content=row['content'],
+                    timestamp=row['timestamp'],
+                    message_id=row['id']
+                )
+
+                user_dialogues[user_id]['messages'].append(message)
+
+                # Обновляем даты
+                if not user_dialogues[user_id]['first_message_date'] or message.timestamp < user_dialogues[user_id][
+                    'first_message_date']:
+                    user_dialogues[user_id]['first_message_date'] = message.timestamp
+
+                if not user_dialogues[user_id]['last_message_date'] or message.timestamp > user_dialogues[user_id][
+                    'last_message_date']:
+                    user_dialogues[user_id]['last_message_date'] = message.timestamp
+
+        # Данные всех пользователей персонажа - одним запросом вместо запроса на каждого
+        users_info = self.get_users_info(list(user_dialogues))
 
         # Преобразуем в объекты UserDialogue
         result = []
@@ -226,32 +262,88 @@ class ConversationExporter:
                 total_messages=len(data['messages']),
                 first_message_date=data['first_message_date'],
                 last_message_date=data['last_message_date'],
-                user_info=self.get_user_info(user_id)
+                user_info=users_info.get(user_id)
             )
             result.append(dialogue)
 
         return result
 
+    def iter_conversation_rows(self, character_ids: List[int]) -> Iterator[Dict]:
+        """Потоком отдать сообщения всех диалогов персонажей, по порядку (персонаж, пользователь, время)"""
+        query = """
+                SELECT cc.id, \
+                       cc.user_id, \
+                       cc.character_id, \
+                       cc.role,
+                       cc.content, \
+                       cc.timestamp
+                FROM conversation_context cc
+                WHERE cc.character_id = ANY(%s)
+                  AND cc.deleted_at IS NULL
+                ORDER BY cc.character_id, cc.user_id, cc.timestamp ASC \
+                """
+
+        with self.connection.cursor(name="conv_all", cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = _STREAM_ITERSIZE
+            cursor.execute(query, (character_ids,))
+            yield from cursor
+
     def get_all_conversations(self) -> Dict[int, Dict]:
         """Получить все диалоги для всех персонажей"""
         characters = self.get_all_characters()
-        all_conversations = {}
+        dialogues_by_character: Dict[int, List[UserDialogue]] = {character_id: [] for character_id in characters}
+
+        # Один проход по сообщениям всех персонажей вместо запроса на каждого:
+        # строки отсортированы, поэтому диалоги собираются вложенной группировкой
+        print("📖 Загрузка диалогов всех персонажей...")
+        rows = self.iter_conversation_rows(list(characters))
+        for character_id, character_rows in groupby(rows, key=itemgetter('character_id')):
+            character_name = characters[character_id].name
+            dialogues = dialogues_by_character[character_id]
+
+            for user_id, user_rows in groupby(character_rows, key=itemgetter('user_id')):
+                messages = [
+                    ConversationMessage(
+                        role=row['role'],
+                        content=row['content'],
+                        timestamp=row['timestamp'],
+                        message_id=row['id']
+                    )
+                    for row in user_rows
+                ]
+                dialogues.append(UserDialogue(
+                    user_id=user_id,
+                    character_id=character_id,
+                    character_name=character_name,
+                    messages=messages,
+                    total_messages=len(messages),
+                    # Сообщения отсортированы по времени
+                    first_message_date=messages[0].timestamp,
+                    last_message_date=messages[-1].timestamp
+                ))
+
+        # Данные всех пользователей - одним запросом
+        users_info = self.get_users_info(list({
+            dialogue.user_id for dialogues in dialogues_by_character.values() for dialogue in dialogues
+        }))
 
+        all_conversations = {}
         for character_id, character in characters.items():
-            print(f"📖 Загрузка диалогов для персонажа: {character.name} (ID: {character_id})")
-            conversations = self.get_conversations_for_character(character_id)
+            conversations = dialogues_by_character[character_id]
+            for dialogue in conversations:
+                dialogue.user_info = users_info.get(dialogue.user_id)
+
+            total_messages = sum(d.total_messages for d in conversations)
             all_conversations[character_id] = {
                 'character': character,
                 'dialogues': conversations,
                 'total_dialogues': len(conversations),
-                'total_messages': sum(len(d.messages) for d in conversations)
+                'total_messages': total_messages
             }
-            print(
-                f"   → Загружено диалогов: {len(conversations)}, сообщений: {sum(len(d.messages) for d in conversations)}")
+            print(f"   {character.name} (ID: {character_id}) → диалогов: {len(conversations)}, сообщений: {total_messages}")
 
         return all_conversations
 
-
 class DialogueExporter:
     """Экспортер диалогов в структурированные файлы"""
 
@@ -226,22 +226,7 @@ class DeepSeekAdvancedLoadTester:
                         print(f"⚠️ Failed to assign tariff for user {user_id}: {message}")
                     else:
                         # Обнуляем счетчики лимитов для тестовых пользователей
-                        self.repositories['rate_limit'].db.execute_query(
-                            '''
-                            INSERT INTO user_rate_limit_tracking
-                            (user_id, minute_counter, hour_counter, day_counter,
-                             last_minute_reset, last_hour_reset, last_day_reset, updated_at)
-                            VALUES (%s, 0, 0, 0, NOW(), NOW(), NOW(), NOW()) ON CONFLICT (user_id) DO
-                            UPDATE SET
-                                minute_counter = 0,
-                                hour_counter = 0,
-                                day_counter = 0,
-                                last_minute_reset = NOW(),
-                                last_hour_reset = NOW(),
-                                last_day_reset = NOW()
-                            ''',
-                            (user_id,)
-                        )
+                        self.repositories['rate_limit'].clear_counters(user_id)
 
                 self.created_user_ids.append(user_id)
 
@@ -274,10 +259,8 @@ class DeepSeekAdvancedLoadTester:
                     (user_id,)
                 )
 
-                self.database.execute_query(
-                    'DELETE FROM user_rate_limit_tracking WHERE user_id = %s',
-                    (user_id,)
-                )
+                # Бакеты rate limit (таблица user_rate_limit_tracking удалена миграцией 7)
+                self.repositories['rate_limit'].clear_counters(user_id)
 
                 self.database.execute_query(
                     'DELETE FROM user_stats WHERE user_id = %s',